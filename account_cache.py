@@ -0,0 +1,135 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+# Cache settings (overridable through the environment)
+ACCOUNT_CACHE_MAX_ENTRIES = int(os.getenv("ACCOUNT_CACHE_MAX_ENTRIES", "10000"))
+ACCOUNT_CACHE_TTL = float(os.getenv("ACCOUNT_CACHE_TTL", "5"))
+ACCOUNT_CACHE_STALE_TTL = float(os.getenv("ACCOUNT_CACHE_STALE_TTL", "30"))
+
+
+class CacheEntry:
+    """A cached value with its freshness deadlines"""
+    __slots__ = ("value", "fresh_until", "stale_until")
+
+    def __init__(self, value: Any, fresh_until: float, stale_until: float):
+        self.value = value
+        self.fresh_until = fresh_until
+        self.stale_until = stale_until
+
+
+class AccountSnapshotCache:
+    """Size-bounded LRU cache of processed account summaries with TTL and stale-while-revalidate"""
+
+    def __init__(self, max_entries: int = ACCOUNT_CACHE_MAX_ENTRIES,
+                 ttl: float = ACCOUNT_CACHE_TTL,
+                 stale_ttl: float = ACCOUNT_CACHE_STALE_TTL):
+        self.max_entries = max(max_entries, 1)
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        # Bumped on invalidation so loads started earlier don't write back old data; only
+        # customers with a load in flight are tracked, so this stays bounded by concurrency
+        self._generations: Dict[str, int] = {}
+        self._loading: Dict[str, int] = {}
+        self._refreshing: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+
+    def get(self, customer_id: str) -> Optional[CacheEntry]:
+        """Get the entry for a customer if it is still servable"""
+        entry = self._entries.get(customer_id)
+        if entry is None:
+            return None
+        if time.monotonic() >= entry.stale_until:
+            del self._entries[customer_id]
+            return None
+        self._entries.move_to_end(customer_id)
+        return entry
+
+    def set(self, customer_id: str, value: Any):
+        """Store a snapshot, evicting the least recently used entries past the size bound"""
+        now = time.monotonic()
+        self._entries[customer_id] = CacheEntry(value, now + self.ttl, now + self.ttl + self.stale_ttl)
+        self._entries.move_to_end(customer_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, customer_id: str):
+        """Drop a customer's snapshot after fresh data has been stored"""
+        if customer_id in self._loading:
+            self._generations[customer_id] = self._generations.get(customer_id, 0) + 1
+        if self._entries.pop(customer_id, None) is not None:
+            self.invalidations += 1
+
+    async def _load(self, customer_id: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Run the loader and cache its result unless the key was invalidated meanwhile"""
+        generation = self._generations.get(customer_id, 0)
+        self._loading[customer_id] = self._loading.get(customer_id, 0) + 1
+        try:
+            value = await loader()
+            if value is not None and self._generations.get(customer_id, 0) == generation:
+                self.set(customer_id, value)
+            return value
+        finally:
+            remaining = self._loading.pop(customer_id) - 1
+            if remaining:
+                self._loading[customer_id] = remaining
+            else:
+                self._generations.pop(customer_id, None)
+
+    async def _refresh(self, customer_id: str, loader: Callable[[], Awaitable[Any]]):
+        """Background revalidation of a stale entry; the stale copy stays on failure"""
+        try:
+            await self._load(customer_id, loader)
+            self.refreshes += 1
+        except Exception:
+            self.refresh_failures += 1
+        finally:
+            self._refreshing.pop(customer_id, None)
+
+    async def get_or_load(self, customer_id: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Serve from cache, revalidating stale entries in the background and loading on miss"""
+        entry = self.get(customer_id)
+        if entry is not None:
+            if time.monotonic() < entry.fresh_until:
+                self.hits += 1
+            else:
+                self.stale_hits += 1
+                if customer_id not in self._refreshing:
+                    self._refreshing[customer_id] = asyncio.ensure_future(self._refresh(customer_id, loader))
+            return entry.value
+
+        self.misses += 1
+        return await self._load(customer_id, loader)
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for tuning the cache"""
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "stale_ttl_seconds": self.stale_ttl,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "background_refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+            "refreshing": len(self._refreshing)
+        }
+
+
+# Global snapshot cache for the account read endpoints
+account_cache = AccountSnapshotCache()
@@ -0,0 +1,184 @@
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+import msgspec
+
+logger = logging.getLogger(__name__)
+
+
+# Gateway response shape; only the fields we extract are declared, the rest are skipped
+class _TradeName(msgspec.Struct):
+    enName: Optional[str] = None
+
+
+class _InstitutionName(msgspec.Struct):
+    enName: Optional[str] = None
+    tradeName: Optional[_TradeName] = None
+
+
+class _InstitutionBasicInfo(msgspec.Struct):
+    name: Optional[_InstitutionName] = None
+
+
+class _AvailableBalance(msgspec.Struct):
+    balanceAmount: Union[float, str, None] = None
+    balancePosition: Optional[str] = None
+
+
+class _MainRoute(msgspec.Struct):
+    address: Optional[str] = None
+
+
+class _GatewayAccount(msgspec.Struct):
+    accountId: Union[str, int, None] = None
+    customerId: Optional[str] = None
+    accountStatus: Optional[str] = None
+    accountCurrency: Optional[str] = None
+    availableBalance: Optional[_AvailableBalance] = None
+    mainRoute: Optional[_MainRoute] = None
+    institutionBasicInfo: Optional[_InstitutionBasicInfo] = None
+
+
+class _AccountsPage(msgspec.Struct):
+    data: List[_GatewayAccount] = msgspec.field(default_factory=list)
+
+
+class AccountRecord(msgspec.Struct):
+    """Compact, slotted account row as stored in the Accounts table"""
+    bank_name: Optional[str]
+    account_status: Optional[str]
+    balance_amount: float
+    balance_position: Optional[str]
+    account_currency: Optional[str]
+    account_address: Optional[str]
+    account_id: Optional[str]
+    customer_id: Optional[str]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "bank_name": self.bank_name,
+            "account_status": self.account_status,
+            "balance_amount": self.balance_amount,
+            "balance_position": self.balance_position,
+            "account_currency": self.account_currency,
+            "account_address": self.account_address,
+            "account_id": self.account_id,
+            "customer_id": self.customer_id
+        }
+
+
+_page_decoder = msgspec.json.Decoder(_AccountsPage)
+
+
+def _to_float(value) -> float:
+    if value is None or value == "":
+        return 0.0
+    return float(value)
+
+
+def _record_from_struct(acc: _GatewayAccount) -> AccountRecord:
+    # Extract bank name with fallback logic
+    bank_name = None
+    info = acc.institutionBasicInfo
+    if info is not None and info.name is not None:
+        trade_name = info.name.tradeName
+        bank_name = (trade_name.enName if trade_name is not None else None) or info.name.enName
+    balance = acc.availableBalance
+    return AccountRecord(
+        bank_name=bank_name,
+        account_status=acc.accountStatus,
+        balance_amount=_to_float(balance.balanceAmount) if balance is not None else 0.0,
+        balance_position=balance.balancePosition if balance is not None else None,
+        account_currency=acc.accountCurrency,
+        account_address=acc.mainRoute.address if acc.mainRoute is not None else None,
+        account_id=str(acc.accountId) if acc.accountId is not None else None,
+        customer_id=acc.customerId
+    )
+
+
+def record_from_dict(acc: Dict) -> AccountRecord:
+    """Extract a record from an already-decoded gateway account dict"""
+    name_obj = (acc.get("institutionBasicInfo") or {}).get("name") or {}
+    bank_name = (name_obj.get("tradeName") or {}).get("enName") or name_obj.get("enName")
+    balance = acc.get("availableBalance") or {}
+    account_id = acc.get("accountId")
+    return AccountRecord(
+        bank_name=bank_name,
+        account_status=acc.get("accountStatus"),
+        balance_amount=_to_float(balance.get("balanceAmount", 0.0)),
+        balance_position=balance.get("balancePosition"),
+        account_currency=acc.get("accountCurrency"),
+        account_address=(acc.get("mainRoute") or {}).get("address"),
+        account_id=str(account_id) if account_id is not None else None,
+        customer_id=acc.get("customerId")
+    )
+
+
+def decode_accounts_page(content: bytes) -> List[AccountRecord]:
+    """Decode a gateway accounts response straight into records"""
+    try:
+        page = _page_decoder.decode(content)
+    except msgspec.ValidationError:
+        # Unexpected field types: fall back to the generic decoder
+        raw = msgspec.json.decode(content)
+        return [record_from_dict(acc) for acc in (raw.get("data") or [])]
+    return [_record_from_struct(acc) for acc in page.data]
+
+
+class AccountAccumulator:
+    """Running account extraction state, fed one page of records at a time"""
+
+    def __init__(self, customer_id: Optional[str] = None):
+        self.records: List[AccountRecord] = []
+        self.total_credit = 0.0
+        self.total_debit = 0.0
+        self.customer_id_value = customer_id
+
+    def add_page(self, page: Iterable[AccountRecord]):
+        """Add a page of records and update the totals"""
+        for record in page:
+            if record.customer_id is None:
+                record.customer_id = self.customer_id_value
+            else:
+                self.customer_id_value = record.customer_id
+            self.records.append(record)
+
+            # Calculate credit and debit totals
+            if record.balance_position == "credit":
+                self.total_credit += record.balance_amount
+            elif record.balance_position == "debit":
+                self.total_debit += record.balance_amount
+
+    def result(self) -> Dict:
+        """Final accounts list and totals"""
+        # Calculate net balance
+        total_balance = self.total_credit - self.total_debit
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "accounts extracted",
+                extra={
+                    "customer_id": self.customer_id_value,
+                    "accounts_count": len(self.records),
+                    "total_credit": self.total_credit,
+                    "total_debit": self.total_debit,
+                    "total_balance": total_balance
+                }
+            )
+            for record in self.records:
+                logger.debug(
+                    "account balance",
+                    extra={
+                        "account_id": record.account_id,
+                        "balance_amount": record.balance_amount,
+                        "balance_position": record.balance_position
+                    }
+                )
+
+        return {
+            "accounts": [record.to_dict() for record in self.records],
+            "total_credit": self.total_credit,
+            "total_debit": self.total_debit,
+            "total_balance": total_balance,
+            "customer_id": self.customer_id_value
+        }
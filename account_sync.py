@@ -0,0 +1,262 @@
+import argparse
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from customer_index import customers_after
+from resilience import CircuitOpenError, RateLimiter, limit_upstream_calls
+
+# Background sync settings (overridable through the environment)
+ACCOUNT_SYNC_ENABLED = os.getenv("ACCOUNT_SYNC_ENABLED", "false").lower() in ("1", "true", "yes")
+ACCOUNT_SYNC_INTERVAL = float(os.getenv("ACCOUNT_SYNC_INTERVAL", "3600"))
+ACCOUNT_SYNC_ACTIVE_INTERVAL = float(os.getenv("ACCOUNT_SYNC_ACTIVE_INTERVAL", "300"))
+ACCOUNT_SYNC_ACTIVE_WINDOW = float(os.getenv("ACCOUNT_SYNC_ACTIVE_WINDOW", "3600"))
+ACCOUNT_SYNC_ACTIVE_MAX = int(os.getenv("ACCOUNT_SYNC_ACTIVE_MAX", "10000"))
+ACCOUNT_SYNC_CONCURRENCY = int(os.getenv("ACCOUNT_SYNC_CONCURRENCY", "4"))
+ACCOUNT_SYNC_RATE_LIMIT = float(os.getenv("ACCOUNT_SYNC_RATE_LIMIT", "5"))
+ACCOUNT_SYNC_PAGE_SIZE = int(os.getenv("ACCOUNT_SYNC_PAGE_SIZE", "1000"))
+# Open-circuit waits per customer before it is counted as failed for the pass
+ACCOUNT_SYNC_MAX_CIRCUIT_WAITS = int(os.getenv("ACCOUNT_SYNC_MAX_CIRCUIT_WAITS", "5"))
+
+
+async def list_customer_ids(table, page_size: int = ACCOUNT_SYNC_PAGE_SIZE) -> List[str]:
+    """Every distinct customer ID in the Accounts table, via keyset paging"""
+    customer_ids = []
+    last_id = None
+    while True:
+        params = {"order": "customer_id.asc", "limit": str(page_size)}
+        if last_id is not None:
+            params.update(customers_after(last_id))
+        rows = (await table.select("customer_id", params).execute_async()).data
+        for row in rows:
+            customer_id = row.get("customer_id")
+            # Rows are per account; consecutive duplicates are the same customer
+            if customer_id is not None and customer_id != last_id:
+                customer_ids.append(customer_id)
+                last_id = customer_id
+        if len(rows) < page_size:
+            return customer_ids
+
+
+class AccountSyncScheduler:
+    """Refreshes stored accounts in the background: recently active customers often, everyone else on a slower cadence"""
+
+    def __init__(self, interval: float = ACCOUNT_SYNC_INTERVAL,
+                 active_interval: float = ACCOUNT_SYNC_ACTIVE_INTERVAL,
+                 active_window: float = ACCOUNT_SYNC_ACTIVE_WINDOW,
+                 concurrency: int = ACCOUNT_SYNC_CONCURRENCY,
+                 rate_limit: float = ACCOUNT_SYNC_RATE_LIMIT,
+                 active_max: int = ACCOUNT_SYNC_ACTIVE_MAX,
+                 max_circuit_waits: int = ACCOUNT_SYNC_MAX_CIRCUIT_WAITS):
+        self.interval = interval
+        self.active_interval = active_interval
+        self.active_window = active_window
+        self.concurrency = max(concurrency, 1)
+        self.active_max = max(active_max, 1)
+        self.max_circuit_waits = max(max_circuit_waits, 0)
+        # One bucket for every sync worker, so the whole pool stays under the gateway limit
+        self.limiter = RateLimiter(rate_limit)
+        # Last request time per customer, most recent last
+        self._active: "OrderedDict[str, float]" = OrderedDict()
+        self._synced_at: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.running = False
+        self.passes = 0
+        self.synced = 0
+        self.failed = 0
+        self.skipped = 0
+        self.circuit_waits = 0
+        self.last_pass: Optional[Dict[str, Any]] = None
+        self.last_error: Optional[str] = None
+
+    def touch(self, customer_id: str):
+        """Record that a client asked about this customer"""
+        self._active[customer_id] = time.monotonic()
+        self._active.move_to_end(customer_id)
+        while len(self._active) > self.active_max:
+            self._active.popitem(last=False)
+
+    def active_customers(self) -> List[str]:
+        """Customers seen within the active window, most recent first"""
+        cutoff = time.monotonic() - self.active_window
+        return [customer_id for customer_id, seen in reversed(self._active.items()) if seen >= cutoff]
+
+    def _order(self, customer_ids: Iterable[str]) -> List[str]:
+        # Recently active customers first, then the rest in table order
+        active = self.active_customers()
+        active_set = set(active)
+        return active + [customer_id for customer_id in dict.fromkeys(customer_ids) if customer_id not in active_set]
+
+    async def _sync_one(self, process: Callable[[str], Awaitable[Any]], customer_id: str) -> Optional[str]:
+        """Refresh one customer; waits out an open gateway circuit (up to max_circuit_waits times)"""
+        waits = 0
+        while True:
+            try:
+                await process(customer_id)
+                self._synced_at[customer_id] = time.monotonic()
+                return None
+            except CircuitOpenError as e:
+                if waits >= self.max_circuit_waits:
+                    return str(e)
+                waits += 1
+                self.circuit_waits += 1
+                await asyncio.sleep(max(e.retry_after, 1.0))
+            except Exception as e:
+                return str(e)
+
+    async def run_once(self, process: Callable[[str], Awaitable[Any]], customer_ids: Iterable[str],
+                       min_age: float = 0.0) -> Dict[str, Any]:
+        """Refresh the given customers through a bounded worker pool under the shared rate limit"""
+        started = time.monotonic()
+        now = started
+        ordered = self._order(customer_ids)
+        queue: "asyncio.Queue[str]" = asyncio.Queue()
+        skipped = 0
+        for customer_id in ordered:
+            synced_at = self._synced_at.get(customer_id)
+            if min_age and synced_at is not None and now - synced_at < min_age:
+                skipped += 1
+                continue
+            queue.put_nowait(customer_id)
+        errors: Dict[str, str] = {}
+        synced = 0
+
+        async def worker():
+            nonlocal synced
+            limit_upstream_calls(self.limiter)
+            while True:
+                try:
+                    customer_id = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                error = await self._sync_one(process, customer_id)
+                if error is None:
+                    synced += 1
+                else:
+                    errors[customer_id] = error
+
+        self.running = True
+        try:
+            await asyncio.gather(*(worker() for _ in range(min(self.concurrency, max(queue.qsize(), 1)))))
+        finally:
+            self.running = False
+        self.passes += 1
+        self.synced += synced
+        self.failed += len(errors)
+        self.skipped += skipped
+        self.last_pass = {
+            "finished_at": time.time(),
+            "duration_seconds": round(time.monotonic() - started, 3),
+            "customers": len(ordered),
+            "synced": synced,
+            "failed": len(errors),
+            "skipped_recently_synced": skipped,
+            "errors": dict(list(errors.items())[:20])
+        }
+        return self.last_pass
+
+    async def _run(self, process: Callable[[str], Awaitable[Any]], table):
+        """Full passes every `interval`, passes over active customers every `active_interval`"""
+        next_full = time.monotonic()
+        while True:
+            try:
+                if time.monotonic() >= next_full:
+                    next_full = time.monotonic() + self.interval
+                    customer_ids = await list_customer_ids(table)
+                    await self.run_once(process, customer_ids, min_age=self.active_interval)
+                else:
+                    await self.run_once(process, [], min_age=self.active_interval)
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+            await asyncio.sleep(min(self.active_interval, max(next_full - time.monotonic(), 0.0)))
+
+    def start(self, process: Callable[[str], Awaitable[Any]], table):
+        """Start the background scheduler"""
+        if ACCOUNT_SYNC_ENABLED and (self._task is None or self._task.done()):
+            self._task = asyncio.ensure_future(self._run(process, table))
+
+    async def stop(self):
+        """Stop the background scheduler"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Cadence, throughput and last pass summary"""
+        return {
+            "enabled": ACCOUNT_SYNC_ENABLED,
+            "running": self.running,
+            "interval_seconds": self.interval,
+            "active_interval_seconds": self.active_interval,
+            "active_customers": len(self.active_customers()),
+            "concurrency": self.concurrency,
+            "rate_limit_per_second": self.limiter.rate,
+            "rate_limit_waits": self.limiter.waits,
+            "passes": self.passes,
+            "synced": self.synced,
+            "failed": self.failed,
+            "skipped_recently_synced": self.skipped,
+            "circuit_waits": self.circuit_waits,
+            "max_circuit_waits": self.max_circuit_waits,
+            "last_pass": self.last_pass,
+            "last_error": self.last_error
+        }
+
+
+# Global background sync scheduler
+account_sync = AccountSyncScheduler()
+
+
+async def _sync_all(processor, customer_ids: Optional[List[str]]) -> Dict[str, Any]:
+    try:
+        if not customer_ids:
+            customer_ids = await list_customer_ids(processor.supabase_manager.client.table("Accounts"))
+        result = await account_sync.run_once(processor.process_customer_accounts_async, customer_ids)
+    finally:
+        # Drain queued rows before exiting; stop() reports what it could not write
+        unwritten = await processor.write_behind.stop()
+    # Rows dropped after repeated failures were not written either
+    result["unwritten_rows"] = unwritten + processor.write_behind.dead_letter_rows
+    result["write_error"] = processor.write_behind.last_error
+    return result
+
+
+async def _run_cli(customer_ids: Optional[List[str]]) -> Dict[str, Any]:
+    from accounts_manager import get_accounts_processor
+    from http_client import async_http_pool, http_pool
+    from write_behind import WRITE_BEHIND_ENABLED
+
+    processor = get_accounts_processor()
+    if WRITE_BEHIND_ENABLED:
+        # Write-behind mode only queues rows; flush them during the pass, not just at exit
+        processor.write_behind.start()
+    try:
+        return await _sync_all(processor, customer_ids)
+    finally:
+        await async_http_pool.close()
+        http_pool.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Refresh stored accounts for every known customer once")
+    parser.add_argument("customer_ids", nargs="*", help="customers to refresh (default: all in the Accounts table)")
+    args = parser.parse_args()
+    result = asyncio.run(_run_cli(args.customer_ids))
+    print(f"synced {result['synced']} of {result['customers']} customers in {result['duration_seconds']}s, "
+          f"{result['failed']} failed")
+    for customer_id, error in result["errors"].items():
+        print(f"  {customer_id}: {error}")
+    if result["unwritten_rows"]:
+        print(f"{result['unwritten_rows']} rows could not be written: {result['write_error']}")
+    raise SystemExit(1 if result["failed"] or result["unwritten_rows"] else 0)
+
+
+if __name__ == "__main__":
+    main()
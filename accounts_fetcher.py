@@ -1,14 +1,39 @@
-import requests
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, Iterator, List
+
+from http_client import GATEWAY_BASE_URL
+from resilience import accounts_upstream
+from metrics import stage
+from account_records import AccountAccumulator, AccountRecord, decode_accounts_page
+
+ACCOUNTS_API_URL = f"{GATEWAY_BASE_URL}/gateway/Accounts/v0.4.3/accounts"
+
+# Pagination settings
+ACCOUNTS_PAGE_SIZE = int(os.getenv("ACCOUNTS_PAGE_SIZE", "10"))
+ACCOUNTS_MAX_PAGES = int(os.getenv("ACCOUNTS_MAX_PAGES", "500"))
+
+# Background threads that fetch page N+1 while page N is being processed
+_prefetch_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("ACCOUNTS_PREFETCH_WORKERS", "8")),
+    thread_name_prefix="accounts-prefetch"
+)
+
 
 class AccountsFetcher:
-    def __init__(self, url, customerId):
+    """Class to fetch account data from external API"""
+
+    def __init__(self, url: str, customerId: str, page_size: int = ACCOUNTS_PAGE_SIZE,
+                 max_pages: int = ACCOUNTS_MAX_PAGES):
         self.url = url
         self.customerId = customerId
+        self.page_size = max(page_size, 1)
+        self.max_pages = max(max_pages, 1)
 
-    def get_full_account(self):
-        url = self.url
-        querystring = {"skip": "0", "limit": "10", "sort": "desc"}
-        headers = {
+    def _build_headers(self) -> Dict[str, str]:
+        """Build the gateway headers for this customer"""
+        return {
             "x-jws-signature": "1",
             "x-auth-date": "1",
             "x-idempotency-key": "1",
@@ -19,10 +44,124 @@ class AccountsFetcher:
             "x-interactions-id": "1",
             "x-customer-id": str(self.customerId)
         }
-        response = requests.get(url, headers=headers, params=querystring)
+
+    def _build_querystring(self, skip: int) -> Dict[str, str]:
+        """Build the paging query for one page"""
+        return {"skip": str(skip), "limit": str(self.page_size), "sort": "desc"}
+
+    def _fresh_accounts(self, page: List[Any], seen_ids: set) -> List[Any]:
+        """Drop accounts already yielded (guards against a gateway that ignores skip)"""
+        fresh = []
+        for acc in page:
+            account_id = acc.account_id if isinstance(acc, AccountRecord) else acc.get("accountId")
+            if account_id is not None:
+                if account_id in seen_ids:
+                    continue
+                seen_ids.add(account_id)
+            fresh.append(acc)
+        return fresh
+
+    def _next_skip(self, page: List[Any], fresh: List[Any], skip: int, pages_read: int):
+        """Offset of the next page, or None once the listing is exhausted"""
+        if len(page) < self.page_size or not fresh or pages_read >= self.max_pages:
+            return None
+        return skip + self.page_size
+
+    def fetch_raw_page(self, skip: int = 0) -> Dict:
+        """Fetch a single page of accounts as the gateway's JSON"""
+        url = self.url
+        response = accounts_upstream.request("GET", url, headers=self._build_headers(), params=self._build_querystring(skip))
         response.raise_for_status()
         return response.json()
 
+    async def fetch_raw_page_async(self, skip: int = 0) -> Dict:
+        """Fetch a single page of accounts as the gateway's JSON without blocking the event loop"""
+        url = self.url
+        response = await accounts_upstream.request_async("GET", url, headers=self._build_headers(), params=self._build_querystring(skip))
+        response.raise_for_status()
+        return response.json()
+
+    def fetch_page(self, skip: int = 0) -> List[AccountRecord]:
+        """Fetch a single page of accounts, decoded straight into records"""
+        url = self.url
+        response = accounts_upstream.request("GET", url, headers=self._build_headers(), params=self._build_querystring(skip))
+        response.raise_for_status()
+        with stage("decode"):
+            return decode_accounts_page(response.content)
+
+    async def fetch_page_async(self, skip: int = 0) -> List[AccountRecord]:
+        """Fetch a single page of accounts, decoded straight into records, without blocking the event loop"""
+        url = self.url
+        response = await accounts_upstream.request_async("GET", url, headers=self._build_headers(), params=self._build_querystring(skip))
+        response.raise_for_status()
+        with stage("decode"):
+            return decode_accounts_page(response.content)
+
+    def iter_account_pages(self, raw: bool = False) -> Iterator[List[Any]]:
+        """Yield account pages as they arrive, prefetching the next page in the background"""
+        if raw:
+            fetch = lambda skip: self.fetch_raw_page(skip).get("data") or []
+        else:
+            fetch = self.fetch_page
+        skip = 0
+        pages_read = 0
+        seen_ids: set = set()
+        future = _prefetch_executor.submit(fetch, skip)
+        while future is not None:
+            raw_page = future.result()
+            pages_read += 1
+            page = self._fresh_accounts(raw_page, seen_ids)
+            skip = self._next_skip(raw_page, page, skip, pages_read)
+            future = _prefetch_executor.submit(fetch, skip) if skip is not None else None
+            if page:
+                yield page
+
+    async def iter_account_pages_async(self, raw: bool = False) -> AsyncIterator[List[Any]]:
+        """Async variant of iter_account_pages"""
+        async def fetch(skip):
+            if raw:
+                return (await self.fetch_raw_page_async(skip)).get("data") or []
+            return await self.fetch_page_async(skip)
+
+        skip = 0
+        pages_read = 0
+        seen_ids: set = set()
+        task = asyncio.ensure_future(fetch(skip))
+        try:
+            while task is not None:
+                raw_page = await task
+                pages_read += 1
+                page = self._fresh_accounts(raw_page, seen_ids)
+                skip = self._next_skip(raw_page, page, skip, pages_read)
+                task = asyncio.ensure_future(fetch(skip)) if skip is not None else None
+                if page:
+                    yield page
+        finally:
+            # Consumer stopped early: drop the speculative prefetch
+            if task is not None and not task.done():
+                task.cancel()
+
+    def get_full_account(self) -> Dict:
+        """Fetch full account data (all pages) from external API"""
+        data = []
+        for page in self.iter_account_pages(raw=True):
+            data.extend(page)
+        return {"data": data}
+
+    async def get_full_account_async(self) -> Dict:
+        """Fetch full account data (all pages) from external API without blocking the event loop"""
+        data = []
+        async for page in self.iter_account_pages_async(raw=True):
+            data.extend(page)
+        return {"data": data}
+
+    def get_account_summary(self) -> Dict:
+        """Fetch every page and extract the accounts and totals"""
+        accumulator = AccountAccumulator(customer_id=self.customerId)
+        for page in self.iter_account_pages():
+            accumulator.add_page(page)
+        return accumulator.result()
+
 if __name__ == "__main__":
     sample_customer_ids = [
         "IND_CUST_001",
@@ -34,41 +173,15 @@ if __name__ == "__main__":
         "BUS_CUST_001",
         "BUS_CUST_005"
     ]
-    url = "https://jpcjofsdev.apigw-az-eu.webmethods.io/gateway/Accounts/v0.4.3/accounts"
+    url = ACCOUNTS_API_URL
     for cid in sample_customer_ids:
         print(f"\nFetching accounts for customer_id={cid}")
         fetcher = AccountsFetcher(url, cid)
         try:
-            data = fetcher.get_full_account()
-            accounts = []
-            total_credit = 0.0
-            total_debit = 0.0
-            customer_id_value = cid
-            for acc in data.get("data", []):
-                name_obj = acc.get("institutionBasicInfo", {}).get("name", {})
-                bank_name = name_obj.get("tradeName", {}).get("enName") or name_obj.get("enName")
-                account_status = acc.get("accountStatus")
-                balance_amount = acc.get("availableBalance", {}).get("balanceAmount", 0.0)
-                balance_position = acc.get("availableBalance", {}).get("balancePosition")
-                account_currency = acc.get("accountCurrency")
-                account_address = acc.get("mainRoute", {}).get("address")
-                account_id = acc.get("accountId")
-                accounts.append({
-                    "bank_name": bank_name,
-                    "account_status": account_status,
-                    "balance_amount": balance_amount,
-                    "balance_position": balance_position,
-                    "account_currency": account_currency,
-                    "account_address": account_address,
-                    "account_id": account_id
-                })
-                # Calculate total credit and debit separately
-                if balance_position == "credit":
-                    total_credit += balance_amount
-                elif balance_position == "debit":
-                    total_debit += balance_amount
-            # Calculate net balance (credit - debit)
-            total_balance = total_credit - total_debit
+            summary = fetcher.get_account_summary()
+            accounts = summary["accounts"]
+            customer_id_value = summary["customer_id"]
+            total_balance = summary["total_balance"]
             print("Customer Summary:")
             print(f"  customerId: {customer_id_value}")
             print(f"  accounts_count: {len(accounts)}")
@@ -0,0 +1,265 @@
+import asyncio
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from supabase_client import postgrest_quote
+
+# Aggregate store settings (overridable through the environment)
+AGGREGATES_LOAD_ON_STARTUP = os.getenv("AGGREGATES_LOAD_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+AGGREGATES_PAGE_SIZE = int(os.getenv("AGGREGATES_PAGE_SIZE", "1000"))
+
+GROUP_BY_COLUMNS = ("currency", "status", "bank")
+
+_POSITION_CODES = {"credit": 1, "debit": -1}
+
+
+class _Categories:
+    """Dictionary encoding for a categorical column"""
+
+    def __init__(self):
+        self.codes: Dict[Optional[str], int] = {}
+        self.labels: List[Optional[str]] = []
+
+    def encode(self, value: Optional[str]) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.labels)
+            self.codes[value] = code
+            self.labels.append(value)
+        return code
+
+
+def _new_customer_aggregate() -> Dict[str, Any]:
+    return {"accounts_count": 0, "total_credit": 0.0, "total_debit": 0.0, "currencies": {}}
+
+
+class AccountAggregateStore:
+    """Columnar in-memory copy of the Accounts table with incrementally maintained customer totals"""
+
+    def __init__(self, capacity: int = 1024):
+        self.capacity = max(capacity, 16)
+        self._lock = threading.Lock()
+        self._rows: Dict[Tuple[str, str], int] = {}
+        self.size = 0
+        # Column arrays are allocated on first use so importing this module doesn't load numpy
+        self.balance = None
+        self.position = None
+        self.columns: Dict[str, Any] = {}
+        self.categories = {name: _Categories() for name in GROUP_BY_COLUMNS}
+        self._customers: Dict[str, Dict[str, Any]] = {}
+        self.version = 0
+        self.updated_at: Optional[float] = None
+        self.loaded_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+        # Keys written live while a load runs; older loaded rows must not overwrite them
+        self._loading = False
+        self._live_keys: Set[Tuple[str, str]] = set()
+
+    def _allocate(self):
+        """Create the column arrays if needed; returns the numpy module"""
+        import numpy as np
+        if self.balance is None:
+            self.balance = np.zeros(self.capacity, dtype=np.float64)
+            self.position = np.zeros(self.capacity, dtype=np.int8)
+            self.columns = {name: np.zeros(self.capacity, dtype=np.int32) for name in GROUP_BY_COLUMNS}
+        return np
+
+    def _grow(self):
+        np = self._allocate()
+        capacity = len(self.balance) * 2
+        self.balance = np.resize(self.balance, capacity)
+        self.position = np.resize(self.position, capacity)
+        for name in GROUP_BY_COLUMNS:
+            self.columns[name] = np.resize(self.columns[name], capacity)
+
+    def _apply(self, customer_id: str, currency: Optional[str], amount: float, position: int, sign: int):
+        """Add (sign=1) or remove (sign=-1) one account's contribution to its customer's totals"""
+        aggregate = self._customers.get(customer_id)
+        if aggregate is None:
+            aggregate = self._customers[customer_id] = _new_customer_aggregate()
+        per_currency = aggregate["currencies"].get(currency)
+        if per_currency is None:
+            per_currency = aggregate["currencies"][currency] = {"accounts_count": 0, "total_credit": 0.0, "total_debit": 0.0}
+        aggregate["accounts_count"] += sign
+        per_currency["accounts_count"] += sign
+        if position == 1:
+            aggregate["total_credit"] += sign * amount
+            per_currency["total_credit"] += sign * amount
+        elif position == -1:
+            aggregate["total_debit"] += sign * amount
+            per_currency["total_debit"] += sign * amount
+        if per_currency["accounts_count"] <= 0:
+            del aggregate["currencies"][currency]
+
+    def upsert(self, rows: Iterable[Dict]):
+        """Apply upserted Accounts rows, updating only the affected customers"""
+        self._upsert(rows, live=True)
+
+    def _upsert(self, rows: Iterable[Dict], live: bool):
+        currency_labels = self.categories["currency"].labels
+        with self._lock:
+            self._allocate()
+            for row in rows:
+                customer_id = row.get("customer_id")
+                key = (row.get("account_id"), customer_id)
+                if live:
+                    if self._loading:
+                        self._live_keys.add(key)
+                elif key in self._live_keys:
+                    # Written after this page was read; the live row is newer
+                    continue
+                amount = float(row.get("balance_amount") or 0.0)
+                position = _POSITION_CODES.get(row.get("balance_position"), 0)
+                currency = row.get("account_currency")
+
+                index = self._rows.get(key)
+                if index is None:
+                    if self.size == len(self.balance):
+                        self._grow()
+                    index = self.size
+                    self._rows[key] = index
+                    self.size += 1
+                else:
+                    # Take back the previous contribution before applying the new one
+                    old_currency = currency_labels[self.columns["currency"][index]]
+                    self._apply(customer_id, old_currency, float(self.balance[index]), int(self.position[index]), -1)
+
+                self.balance[index] = amount
+                self.position[index] = position
+                self.columns["currency"][index] = self.categories["currency"].encode(currency)
+                self.columns["status"][index] = self.categories["status"].encode(row.get("account_status"))
+                self.columns["bank"][index] = self.categories["bank"].encode(row.get("bank_name"))
+                self._apply(customer_id, currency, amount, position, 1)
+            self.version += 1
+            self.updated_at = time.time()
+
+    def customer_summary(self, customer_id: str) -> Optional[Dict[str, Any]]:
+        """Materialised totals for one customer (O(1))"""
+        with self._lock:
+            aggregate = self._customers.get(customer_id)
+            if aggregate is None or aggregate["accounts_count"] <= 0:
+                return None
+            currencies = {
+                currency: {**values, "total_balance": values["total_credit"] - values["total_debit"]}
+                for currency, values in aggregate["currencies"].items()
+            }
+            return {
+                "customerId": customer_id,
+                "accounts_count": aggregate["accounts_count"],
+                "total_credit": aggregate["total_credit"],
+                "total_debit": aggregate["total_debit"],
+                "total_balance": aggregate["total_credit"] - aggregate["total_debit"],
+                "currencies": currencies,
+                "version": self.version,
+                "updated_at": self.updated_at
+            }
+
+    def portfolio_summary(self, group_by: List[str]) -> Dict[str, Any]:
+        """Vectorised group-by over the columnar store"""
+        with self._lock:
+            np = self._allocate()
+            n = self.size
+            balance = self.balance[:n]
+            position = self.position[:n]
+            credit = np.where(position == 1, balance, 0.0)
+            debit = np.where(position == -1, balance, 0.0)
+
+            # Combine the group columns into one mixed-radix key per row
+            keys = np.zeros(n, dtype=np.int64)
+            radices = []
+            for name in group_by:
+                radix = max(len(self.categories[name].labels), 1)
+                keys = keys * radix + self.columns[name][:n]
+                radices.append(radix)
+
+            groups = []
+            if n:
+                unique_keys, inverse = np.unique(keys, return_inverse=True)
+                counts = np.bincount(inverse)
+                credit_sums = np.bincount(inverse, weights=credit)
+                debit_sums = np.bincount(inverse, weights=debit)
+                for i, key in enumerate(unique_keys.tolist()):
+                    labels = {}
+                    for name, radix in zip(reversed(group_by), reversed(radices)):
+                        key, code = divmod(key, radix)
+                        labels[name] = self.categories[name].labels[code]
+                    groups.append({
+                        **{name: labels[name] for name in group_by},
+                        "accounts_count": int(counts[i]),
+                        "total_credit": float(credit_sums[i]),
+                        "total_debit": float(debit_sums[i]),
+                        "total_balance": float(credit_sums[i] - debit_sums[i])
+                    })
+
+            return {
+                "group_by": group_by,
+                "customers_count": sum(1 for a in self._customers.values() if a["accounts_count"] > 0),
+                "accounts_count": n,
+                "groups": groups,
+                "version": self.version,
+                "updated_at": self.updated_at
+            }
+
+    async def load(self, table, page_size: int = AGGREGATES_PAGE_SIZE) -> int:
+        """Bulk-load the Accounts table with keyset paging on (customer_id, account_id)"""
+        columns = "account_id,customer_id,balance_amount,balance_position,account_currency,account_status,bank_name"
+        last = None
+        loaded = 0
+        with self._lock:
+            self._loading = True
+            self._live_keys = set()
+        try:
+            while True:
+                params = {"order": "customer_id.asc,account_id.asc", "limit": str(page_size)}
+                if last is not None:
+                    customer_id, account_id = last
+                    # Quoted so IDs containing PostgREST reserved characters stay intact
+                    params["or"] = (
+                        f"(customer_id.gt.{postgrest_quote(customer_id)},"
+                        f"and(customer_id.eq.{postgrest_quote(customer_id)},account_id.gt.{postgrest_quote(account_id)}))"
+                    )
+                rows = (await table.select(columns, params).execute_async()).data
+                if rows:
+                    self._upsert(rows, live=False)
+                    loaded += len(rows)
+                    last = (rows[-1].get("customer_id"), rows[-1].get("account_id"))
+                if len(rows) < page_size:
+                    break
+            self.loaded_at = time.time()
+            self.last_error = None
+            return loaded
+        except Exception as e:
+            self.last_error = str(e)
+            raise
+        finally:
+            with self._lock:
+                self._loading = False
+                self._live_keys = set()
+
+    def start(self, table):
+        """Load the stored accounts in the background"""
+        async def run():
+            try:
+                await self.load(table)
+            except Exception:
+                pass
+
+        if AGGREGATES_LOAD_ON_STARTUP and (self._task is None or self._task.done()):
+            self._task = asyncio.ensure_future(run())
+
+    async def stop(self):
+        """Cancel a load that is still running"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# Global aggregate store
+account_aggregates = AccountAggregateStore()
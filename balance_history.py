@@ -0,0 +1,351 @@
+import asyncio
+import math
+import os
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+# Balance history settings (overridable through the environment)
+BALANCE_HISTORY_ENABLED = os.getenv("BALANCE_HISTORY_ENABLED", "true").lower() in ("1", "true", "yes")
+BALANCE_HISTORY_FLUSH_INTERVAL = float(os.getenv("BALANCE_HISTORY_FLUSH_INTERVAL", "30"))
+BALANCE_HISTORY_FLUSH_ROWS = int(os.getenv("BALANCE_HISTORY_FLUSH_ROWS", "1000"))
+BALANCE_HISTORY_MAX_PENDING = int(os.getenv("BALANCE_HISTORY_MAX_PENDING", "100000"))
+BALANCE_HISTORY_MAX_POINTS = int(os.getenv("BALANCE_HISTORY_MAX_POINTS", "100000"))
+BALANCE_HISTORY_PAGE_SIZE = int(os.getenv("BALANCE_HISTORY_PAGE_SIZE", "1000"))
+# Buckets returned when no resolution is given, and the most a query may ask for
+BALANCE_HISTORY_DEFAULT_BUCKETS = int(os.getenv("BALANCE_HISTORY_DEFAULT_BUCKETS", "200"))
+BALANCE_HISTORY_MAX_BUCKETS = int(os.getenv("BALANCE_HISTORY_MAX_BUCKETS", "5000"))
+
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+_POSITION_CODES = {"credit": 1, "debit": -1}
+
+
+def parse_resolution(value: str) -> float:
+    """Bucket width in seconds from `3600`, `15m`, `1h`, `1d` or `1w`"""
+    value = value.strip().lower()
+    try:
+        if value and value[-1] in _UNITS:
+            seconds = float(value[:-1]) * _UNITS[value[-1]]
+        else:
+            seconds = float(value)
+    except ValueError:
+        raise ValueError(f"Invalid resolution {value!r}; use seconds or a number with s/m/h/d/w")
+    if not seconds > 0:
+        raise ValueError("Resolution must be positive")
+    return seconds
+
+
+# Postgres trims trailing fractional zeros and may send a bare-hour offset (`+00`)
+_PG_TIMESTAMP = re.compile(r"^(.*?\d{2}:\d{2}:\d{2})(?:\.(\d+))?([+-]\d{2})?(:?\d{2})?$")
+
+
+def parse_timestamp(value: str) -> float:
+    """Epoch seconds from an ISO date or date-time; naive values are taken as UTC"""
+    # Python 3.9's fromisoformat needs a Z-less offset with minutes and 3 or 6 fractional digits
+    value = value.strip().replace("Z", "+00:00")
+    match = _PG_TIMESTAMP.match(value)
+    if match:
+        base, fraction, offset_hours, offset_minutes = match.groups()
+        value = base
+        if fraction:
+            value += "." + fraction[:6].ljust(6, "0")
+        if offset_hours:
+            value += offset_hours + ":" + (offset_minutes or "00").lstrip(":")
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def _isoformat(ts: float) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat()
+
+
+class _Series:
+    """Change points of one account's signed balance (credit positive, debit negative)"""
+    __slots__ = ("ts", "value", "size", "last_observed_at", "loaded")
+
+    def __init__(self, np):
+        self.ts = np.empty(16, dtype=np.float64)
+        self.value = np.empty(16, dtype=np.float64)
+        self.size = 0
+        self.last_observed_at: Optional[float] = None
+        self.loaded = False
+
+    def append(self, np, ts: float, value: float) -> bool:
+        """Add an observation; unchanged balances only extend the current step"""
+        self.last_observed_at = ts if self.last_observed_at is None else max(self.last_observed_at, ts)
+        if self.size and self.value[self.size - 1] == value and self.ts[self.size - 1] <= ts:
+            return False
+        if self.size == len(self.ts):
+            self.ts = np.resize(self.ts, self.size * 2)
+            self.value = np.resize(self.value, self.size * 2)
+        if self.size and ts < self.ts[self.size - 1]:
+            # Out of order (e.g. loaded history); keep the arrays sorted
+            at = int(np.searchsorted(self.ts[:self.size], ts, side="left"))
+            if self.ts[at] == ts:
+                # Already known (a point this process recorded and flushed)
+                return False
+            self.ts[at + 1:self.size + 1] = self.ts[at:self.size]
+            self.value[at + 1:self.size + 1] = self.value[at:self.size]
+            self.ts[at] = ts
+            self.value[at] = value
+        else:
+            self.ts[self.size] = ts
+            self.value[self.size] = value
+        self.size += 1
+        if self.size > BALANCE_HISTORY_MAX_POINTS:
+            drop = self.size - BALANCE_HISTORY_MAX_POINTS
+            self.ts[:BALANCE_HISTORY_MAX_POINTS] = self.ts[drop:self.size]
+            self.value[:BALANCE_HISTORY_MAX_POINTS] = self.value[drop:self.size]
+            self.size = BALANCE_HISTORY_MAX_POINTS
+        return True
+
+
+class BalanceHistoryStore:
+    """Per-account balance time series kept as numpy change points, persisted to `account_balances` in batches"""
+
+    def __init__(self, flush_interval: float = BALANCE_HISTORY_FLUSH_INTERVAL,
+                 flush_rows: int = BALANCE_HISTORY_FLUSH_ROWS,
+                 max_pending: int = BALANCE_HISTORY_MAX_PENDING):
+        self.flush_interval = flush_interval
+        self.flush_rows = max(flush_rows, 1)
+        self.max_pending = max(max_pending, 1)
+        self._lock = threading.Lock()
+        self._series: Dict[str, _Series] = {}
+        self._pending: List[Dict] = []
+        self._table = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.observations = 0
+        self.points = 0
+        self.flushed_rows = 0
+        self.flushes = 0
+        self.flush_failures = 0
+        self.dropped_rows = 0
+        self.loads = 0
+        self.skipped_rows = 0
+        self.last_error: Optional[str] = None
+
+    def record(self, accounts: Iterable[Dict], observed_at: Optional[float] = None):
+        """Append the balances of freshly extracted accounts"""
+        if not BALANCE_HISTORY_ENABLED:
+            return
+        import numpy as np
+        observed_at = time.time() if observed_at is None else observed_at
+        with self._lock:
+            for account in accounts:
+                account_id = account.get("account_id")
+                if account_id is None:
+                    continue
+                position = _POSITION_CODES.get(account.get("balance_position"), 0)
+                amount = float(account.get("balance_amount") or 0.0)
+                series = self._series.get(account_id)
+                if series is None:
+                    series = self._series[account_id] = _Series(np)
+                self.observations += 1
+                if not series.append(np, observed_at, amount * (position or 1)):
+                    continue
+                self.points += 1
+                # Only changes are persisted; the next flush writes them in one request
+                self._pending.append({
+                    "account_id": account_id,
+                    "customer_id": account.get("customer_id"),
+                    "balance_amount": amount,
+                    "balance_position": account.get("balance_position"),
+                    "observed_at": _isoformat(observed_at)
+                })
+            if len(self._pending) > self.max_pending:
+                drop = len(self._pending) - self.max_pending
+                del self._pending[:drop]
+                self.dropped_rows += drop
+        if len(self._pending) >= self.flush_rows and self._wake is not None:
+            self._wake.set()
+
+    async def flush(self) -> int:
+        """Write buffered change points; failed rows stay buffered for the next attempt"""
+        if self._table is None or not self._pending:
+            return 0
+        with self._lock:
+            batch, self._pending = self._pending, []
+        try:
+            await self._table.upsert(batch, on_conflict="account_id,observed_at").execute_async()
+        except Exception as e:
+            self.flush_failures += 1
+            self.last_error = str(e)
+            failed = getattr(e, "failed_rows", None) or batch
+            with self._lock:
+                self._pending[:0] = failed
+            return len(batch) - len(failed)
+        self.flushes += 1
+        self.flushed_rows += len(batch)
+        self.last_error = None
+        return len(batch)
+
+    async def _load(self, account_id: str):
+        """Merge the account's persisted history into memory (once per account)"""
+        import numpy as np
+        last_observed = None
+        rows_loaded = []
+        while True:
+            params = {
+                "account_id": f"eq.{account_id}",
+                "order": "observed_at.asc",
+                "limit": str(BALANCE_HISTORY_PAGE_SIZE)
+            }
+            if last_observed is not None:
+                params["observed_at"] = f"gt.{last_observed}"
+            rows = (await self._table.select("balance_amount,balance_position,observed_at", params).execute_async()).data
+            rows_loaded.extend(rows)
+            if len(rows) < BALANCE_HISTORY_PAGE_SIZE:
+                break
+            last_observed = rows[-1]["observed_at"]
+        with self._lock:
+            series = self._series.get(account_id)
+            if series is None:
+                # Unknown account IDs come from clients; only keep series that have data
+                if not rows_loaded:
+                    return
+                series = self._series[account_id] = _Series(np)
+            if series.loaded:
+                return
+            for row in rows_loaded:
+                position = _POSITION_CODES.get(row.get("balance_position"), 0)
+                try:
+                    observed_at = parse_timestamp(row["observed_at"])
+                except (KeyError, TypeError, ValueError) as e:
+                    # One bad row shouldn't keep the rest of the history from loading
+                    self.skipped_rows += 1
+                    self.last_error = f"Unparsable observed_at {row.get('observed_at')!r}: {e}"
+                    continue
+                series.append(np, observed_at, float(row.get("balance_amount") or 0.0) * (position or 1))
+            series.loaded = True
+        self.loads += 1
+
+    async def history(self, account_id: str, start: Optional[float] = None, end: Optional[float] = None,
+                      resolution: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Downsampled balance between start and end: min, max and last value per bucket"""
+        import numpy as np
+        series = self._series.get(account_id)
+        if self._table is not None and (series is None or not series.loaded):
+            try:
+                await self._load(account_id)
+            except Exception as e:
+                self.last_error = str(e)
+            series = self._series.get(account_id)
+        if series is None or series.size == 0:
+            return None
+
+        with self._lock:
+            ts = series.ts[:series.size].copy()
+            values = series.value[:series.size].copy()
+            history_loaded = series.loaded
+        end = time.time() if end is None else end
+        start = float(ts[0]) if start is None else start
+        if end <= start:
+            raise ValueError("`to` must be after `from`")
+        if resolution is None:
+            resolution = (end - start) / BALANCE_HISTORY_DEFAULT_BUCKETS
+        buckets = math.ceil((end - start) / resolution)
+        if buckets > BALANCE_HISTORY_MAX_BUCKETS:
+            raise ValueError(
+                f"{buckets} buckets requested; use a coarser resolution (at most {BALANCE_HISTORY_MAX_BUCKETS})"
+            )
+
+        edges = start + resolution * np.arange(buckets + 1, dtype=np.float64)
+        edges[-1] = min(edges[-1], end)
+        mins = np.full(buckets, np.inf)
+        maxs = np.full(buckets, -np.inf)
+
+        # Balance is a step function: each bucket also sees the value carried in from before it
+        carried = np.searchsorted(ts, edges[:-1], side="right") - 1
+        has_carry = carried >= 0
+        carry_values = values[np.maximum(carried, 0)]
+        mins = np.where(has_carry, carry_values, mins)
+        maxs = np.where(has_carry, carry_values, maxs)
+
+        first, last = np.searchsorted(ts, [start, end], side="left")
+        inside_ts = ts[first:last]
+        inside_values = values[first:last]
+        bucket_of = np.minimum(((inside_ts - start) // resolution).astype(np.int64), buckets - 1)
+        np.minimum.at(mins, bucket_of, inside_values)
+        np.maximum.at(maxs, bucket_of, inside_values)
+        changes = np.bincount(bucket_of, minlength=buckets)
+
+        closing = np.searchsorted(ts, edges[1:], side="left") - 1
+        present = closing >= 0
+        last_values = values[np.maximum(closing, 0)]
+
+        points = [
+            {
+                "from": _isoformat(edges[i]),
+                "to": _isoformat(edges[i + 1]),
+                "min": float(mins[i]),
+                "max": float(maxs[i]),
+                "last": float(last_values[i]),
+                "changes": int(changes[i])
+            }
+            for i in np.flatnonzero(present).tolist()
+        ]
+        return {
+            "account_id": account_id,
+            "from": _isoformat(start),
+            "to": _isoformat(end),
+            "resolution_seconds": resolution,
+            "buckets": len(points),
+            "last_observed_at": _isoformat(series.last_observed_at) if series.last_observed_at else None,
+            "history_loaded": history_loaded,
+            "points": points
+        }
+
+    async def _run(self):
+        """Flush when enough rows are buffered or every flush_interval"""
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    def start(self, table):
+        """Persist to `table` in the background"""
+        self._table = table
+        if self._wake is None:
+            self._wake = asyncio.Event()
+        if BALANCE_HISTORY_ENABLED and (self._task is None or self._task.done()):
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """Stop the flusher and write what is still buffered"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        """Series sizes and persistence counters"""
+        return {
+            "enabled": BALANCE_HISTORY_ENABLED,
+            "accounts": len(self._series),
+            "observations": self.observations,
+            "points": self.points,
+            "pending_rows": len(self._pending),
+            "flushed_rows": self.flushed_rows,
+            "flushes": self.flushes,
+            "flush_failures": self.flush_failures,
+            "dropped_rows": self.dropped_rows,
+            "history_loads": self.loads,
+            "skipped_rows": self.skipped_rows,
+            "last_error": self.last_error
+        }
+
+
+# Global balance history store
+balance_history = BalanceHistoryStore()
@@ -0,0 +1,110 @@
+"""Micro-benchmark: per-account cost of decoding and extracting a gateway accounts page.
+
+Run from the repository root:
+
+    python -m bench.extract_bench --accounts 1000 --repeat 200
+"""
+import argparse
+import json
+import time
+
+from account_records import AccountAccumulator, decode_accounts_page, record_from_dict
+
+
+def make_page(count: int) -> bytes:
+    """Build a gateway-shaped accounts response with `count` accounts"""
+    data = []
+    for i in range(count):
+        data.append({
+            "accountId": f"ACC-{i:06d}",
+            "customerId": "CORP_CUST_001",
+            "accountStatus": "active",
+            "accountCurrency": "JOD",
+            "accountType": "current",
+            "availableBalance": {"balanceAmount": f"{1000 + i}.25", "balancePosition": "credit" if i % 3 else "debit"},
+            "mainRoute": {"address": f"JO71CBJO{i:022d}", "schema": "IBAN"},
+            "institutionBasicInfo": {
+                "name": {"enName": "Bank", "arName": "Bank", "tradeName": {"enName": "Trade Bank"}},
+                "institutionId": "INST-1"
+            },
+            "accountHolderName": {"enName": "Holder"},
+            "openingDate": "2020-01-01"
+        })
+    return json.dumps({"data": data, "meta": {"count": count}}).encode("utf-8")
+
+
+def legacy_extract(content: bytes):
+    """The previous path: json.loads into dicts, then chained .get() walks into row dicts"""
+    raw_data = json.loads(content)
+    accounts = []
+    total_credit = 0.0
+    total_debit = 0.0
+    customer_id_value = None
+    for acc in raw_data.get("data", []):
+        name_obj = acc.get("institutionBasicInfo", {}).get("name", {})
+        bank_name = name_obj.get("tradeName", {}).get("enName") or name_obj.get("enName")
+        balance_amount = float(acc.get("availableBalance", {}).get("balanceAmount", 0.0))
+        balance_position = acc.get("availableBalance", {}).get("balancePosition")
+        customer_id_value = acc.get("customerId", customer_id_value)
+        accounts.append({
+            "bank_name": bank_name,
+            "account_status": acc.get("accountStatus"),
+            "balance_amount": balance_amount,
+            "balance_position": balance_position,
+            "account_currency": acc.get("accountCurrency"),
+            "account_address": acc.get("mainRoute", {}).get("address"),
+            "account_id": acc.get("accountId"),
+            "customer_id": customer_id_value
+        })
+        if balance_position == "credit":
+            total_credit += balance_amount
+        elif balance_position == "debit":
+            total_debit += balance_amount
+    return accounts, total_credit - total_debit
+
+
+def records_extract(content: bytes):
+    """The current path: decode bytes straight into records and accumulate"""
+    accumulator = AccountAccumulator()
+    accumulator.add_page(decode_accounts_page(content))
+    return accumulator.result()
+
+
+def dict_fallback_extract(content: bytes):
+    """Records built from already-decoded dicts (the fallback path)"""
+    accumulator = AccountAccumulator()
+    accumulator.add_page(record_from_dict(acc) for acc in json.loads(content)["data"])
+    return accumulator.result()
+
+
+def run(fn, content: bytes, repeat: int) -> float:
+    """Best-of-three mean seconds per call"""
+    best = float("inf")
+    for _ in range(3):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            fn(content)
+        best = min(best, (time.perf_counter() - started) / repeat)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--accounts", type=int, default=1000, help="accounts per page")
+    parser.add_argument("--repeat", type=int, default=200, help="calls per timing round")
+    args = parser.parse_args()
+
+    content = make_page(args.accounts)
+    print(f"page: {args.accounts} accounts, {len(content)} bytes")
+    baseline = None
+    for name, fn in (("legacy dict walk", legacy_extract),
+                     ("records (fallback)", dict_fallback_extract),
+                     ("records (direct)", records_extract)):
+        per_call = run(fn, content, args.repeat)
+        per_account_us = per_call / args.accounts * 1e6
+        baseline = baseline or per_account_us
+        print(f"{name:<20} {per_account_us:8.3f} us/account  ({baseline / per_account_us:4.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+"""Load benchmark: drive every API route against local upstream stand-ins and compare with a baseline.
+
+Run from the repository root:
+
+    python -m bench.load_bench --requests 200 --concurrency 16 --save-baseline bench/baseline.json
+    # ...change code...
+    python -m bench.load_bench --requests 200 --concurrency 16 --baseline bench/baseline.json
+
+The stub upstreams (bench/stub_upstreams.py) and the API (uvicorn main:app) are started as
+subprocesses on free ports. Pass --api-url to drive an API that is already running instead.
+Exits with status 1 when a --baseline comparison finds a regression.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Callable, Dict, List
+
+import httpx
+
+
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    route: str
+    # Builds (url, request kwargs) for one request
+    build: Callable[["Fixtures"], tuple]
+
+
+class Fixtures:
+    """Customers and accounts the scenarios pick from"""
+
+    def __init__(self, customers: int, accounts: int):
+        self.customers = [f"BENCH_CUST_{i:04d}" for i in range(customers)]
+        self.accounts = accounts
+        self.replay_key = f"bench-{uuid.uuid4().hex}"
+
+    def customer(self) -> str:
+        return random.choice(self.customers)
+
+    def account(self) -> str:
+        return f"{self.customer()}-ACC-{random.randrange(self.accounts):04d}"
+
+
+def _get(path: str, **params):
+    return path, {"params": params} if params else {}
+
+
+# Profile routes are only served with a token; the API started here is given this one
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "bench")
+
+
+def _get_profiles(path: str):
+    return path, {"headers": {"X-Profile": PROFILE_TOKEN}}
+
+
+SCENARIOS: List[Scenario] = [
+    Scenario("health", "GET", "/health", lambda f: _get("/health")),
+    Scenario("accounts.query", "GET", "/accounts", lambda f: _get("/accounts", customer_id=f.customer())),
+    Scenario("accounts.path", "GET", "/accounts/{customer_id}", lambda f: _get(f"/accounts/{f.customer()}")),
+    Scenario("fetch-accounts", "POST", "/fetch-accounts",
+             lambda f: ("/fetch-accounts", {"params": {"customer_id": f.customer()}})),
+    Scenario("fetch-accounts.batch", "POST", "/fetch-accounts/batch",
+             lambda f: ("/fetch-accounts/batch", {"json": {"customer_ids": random.sample(f.customers, min(10, len(f.customers)))}})),
+    Scenario("customer-summary", "GET", "/customers/{customer_id}/summary",
+             lambda f: _get(f"/customers/{f.customer()}/summary")),
+    Scenario("portfolio-summary", "GET", "/portfolio/summary",
+             lambda f: _get("/portfolio/summary", group_by="currency,status")),
+    Scenario("customer-exists", "GET", "/customer-exists/{customer_id}",
+             lambda f: _get(f"/customer-exists/{f.customer()}")),
+    Scenario("transactions", "GET", "/accounts/{account_id}/transactions",
+             lambda f: _get(f"/accounts/{f.account()}/transactions", limit=100)),
+    Scenario("transactions.ndjson", "GET", "/accounts/{account_id}/transactions",
+             lambda f: _get(f"/accounts/{f.account()}/transactions", format="ndjson", limit=1000)),
+    Scenario("transactions.summary", "GET", "/accounts/{account_id}/transactions/summary",
+             lambda f: _get(f"/accounts/{f.account()}/transactions/summary", period=random.choice(["month", "week"]))),
+    Scenario("balance-history", "GET", "/accounts/{account_id}/balance-history",
+             lambda f: _get(f"/accounts/{f.account()}/balance-history", resolution="1h")),
+    Scenario("offers", "GET", "/offers", lambda f: _get("/offers")),
+    Scenario("payment-plan", "POST", "/payment-plan",
+             lambda f: ("/payment-plan", {"params": {"amount": 10, "x_customer_id": f.customer()}})),
+    Scenario("payment-plan.blocks", "POST", "/payment-plan/blocks",
+             lambda f: ("/payment-plan/blocks", {"json": {"payment_plan_id": f"PP-{random.randrange(50)}", "x_customer_id": f.customer()}})),
+    Scenario("payment-initiate", "POST", "/payment-initiate",
+             lambda f: ("/payment-initiate", {"params": {"payment_plan_id": "PP-1", "block_id": "BLOCK-1", "amount": 10, "x_customer_id": f.customer()},
+                                              "headers": {"Idempotency-Key": uuid.uuid4().hex}})),
+    Scenario("payments", "POST", "/payments",
+             lambda f: ("/payments", {"params": {"amount": 10, "x_customer_id": f.customer()},
+                                      "headers": {"Idempotency-Key": uuid.uuid4().hex}})),
+    Scenario("profiles", "GET", "/profiles", lambda f: _get_profiles("/profiles")),
+    Scenario("profiles.download", "GET", "/profiles/{profile_id}", lambda f: _get_profiles("/profiles/missing")),
+    Scenario("payments.replay", "POST", "/payments",
+             lambda f: ("/payments", {"params": {"amount": 10, "x_customer_id": "BENCH_REPLAY"},
+                                      "headers": {"Idempotency-Key": f.replay_key}})),
+]
+
+# Cheap read-only routes, one scenario each
+for _path in ("/cache/accounts/stats", "/write-behind/stats", "/cache/customer-index/stats",
+              "/cache/idempotency/stats", "/single-flight/stats", "/upstreams/stats",
+              "/cache/offers/stats", "/metrics", "/sync/stats",
+              "/cache/fingerprints/stats", "/cache/balance-history/stats",
+              "/cache/transaction-summaries/stats", "/cache/responses/stats"):
+    SCENARIOS.append(Scenario(_path.strip("/").replace("/", "."), "GET", _path, lambda f, p=_path: _get(p)))
+
+
+def uncovered_routes() -> List[str]:
+    """API routes no scenario exercises (docs routes excluded)"""
+    from accounts_manager import app
+    covered = {(s.method, s.route) for s in SCENARIOS}
+    missing = []
+    for route in app.routes:
+        if route.path in ("/openapi.json", "/docs", "/docs/oauth2-redirect", "/redoc"):
+            continue
+        for method in sorted(getattr(route, "methods", None) or ()):
+            if method != "HEAD" and (method, route.path) not in covered:
+                missing.append(f"{method} {route.path}")
+    return missing
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(int(round(q * (len(ordered) - 1))), len(ordered) - 1)]
+
+
+async def run_scenario(client: httpx.AsyncClient, scenario: Scenario, fixtures: Fixtures,
+                       requests: int, concurrency: int) -> Dict:
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    remaining = [requests]
+
+    async def worker():
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            url, kwargs = scenario.build(fixtures)
+            started = time.perf_counter()
+            try:
+                response = await client.request(scenario.method, url, **kwargs)
+                await response.aread()
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(concurrency, 1))))
+    elapsed = time.perf_counter() - started
+    ordered = sorted(latencies)
+    errors = sum(count for status, count in statuses.items() if not status.isdigit() or int(status) >= 500)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "statuses": statuses,
+        "rps": len(latencies) / elapsed if elapsed > 0 else 0.0,
+        "p50_ms": percentile(ordered, 0.50) * 1000,
+        "p95_ms": percentile(ordered, 0.95) * 1000,
+        "p99_ms": percentile(ordered, 0.99) * 1000
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_until_up(url: str, process: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"process serving {url} exited with {process.returncode}")
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+
+def start_servers(args) -> tuple:
+    """Start the stub upstreams and the API; returns (api_url, processes)"""
+    stub_port, api_port = _free_port(), _free_port()
+    stub = subprocess.Popen([
+        sys.executable, "-m", "bench.stub_upstreams", "--port", str(stub_port),
+        "--latency-ms", str(args.stub_latency_ms), "--jitter-ms", str(args.stub_jitter_ms),
+        "--accounts", str(args.accounts), "--transactions", str(args.transactions)
+    ])
+    processes = [stub]
+    try:
+        _wait_until_up(f"http://127.0.0.1:{stub_port}/", stub)
+        stub_url = f"http://127.0.0.1:{stub_port}"
+        env = {
+            **os.environ,
+            "GATEWAY_BASE_URL": stub_url,
+            "SUPABASE_URL": stub_url,
+            "HTTP2_ENABLED": "false",
+            "PROFILE_TOKEN": PROFILE_TOKEN,
+        }
+        api = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(api_port), "--log-level", "warning"],
+            env=env
+        )
+        processes.append(api)
+        api_url = f"http://127.0.0.1:{api_port}"
+        _wait_until_up(f"{api_url}/health", api)
+        return api_url, processes
+    except Exception:
+        stop_servers(processes)
+        raise
+
+
+def stop_servers(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Names of scenarios whose p95 rose or throughput fell by more than threshold"""
+    regressions = []
+    print()
+    print(f"{'scenario':<28} {'p95 ms':>9} {'base':>9} {'delta':>8} {'rps':>9} {'base':>9} {'delta':>8}")
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            print(f"{name:<28} (not in baseline)")
+            continue
+        p95_delta = (current["p95_ms"] - previous["p95_ms"]) / previous["p95_ms"] if previous["p95_ms"] else 0.0
+        rps_delta = (current["rps"] - previous["rps"]) / previous["rps"] if previous["rps"] else 0.0
+        regressed = p95_delta > threshold or rps_delta < -threshold or current["errors"] > previous["errors"]
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<28} {current['p95_ms']:9.1f} {previous['p95_ms']:9.1f} {p95_delta:+8.1%} "
+              f"{current['rps']:9.1f} {previous['rps']:9.1f} {rps_delta:+8.1%}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+async def run_all(api_url: str, args) -> Dict:
+    fixtures = Fixtures(args.customers, args.accounts)
+    scenarios = [s for s in SCENARIOS if not args.only or s.name in args.only]
+    limits = httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency * 2)
+    async with httpx.AsyncClient(base_url=api_url, timeout=60.0, limits=limits) as client:
+        # Store every customer first so the summary and existence routes find data
+        for i in range(0, len(fixtures.customers), 100):
+            await client.post("/fetch-accounts/batch", json={"customer_ids": fixtures.customers[i:i + 100]})
+
+        results = {}
+        print(f"{'scenario':<28} {'reqs':>6} {'err':>5} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+        for scenario in scenarios:
+            result = await run_scenario(client, scenario, fixtures, args.requests, args.concurrency)
+            results[scenario.name] = result
+            print(f"{scenario.name:<28} {result['requests']:>6} {result['errors']:>5} {result['rps']:9.1f} "
+                  f"{result['p50_ms']:9.1f} {result['p95_ms']:9.1f} {result['p99_ms']:9.1f}")
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent requests per scenario")
+    parser.add_argument("--customers", type=int, default=50, help="distinct customers to spread requests over")
+    parser.add_argument("--accounts", type=int, default=25, help="stub gateway accounts per customer")
+    parser.add_argument("--transactions", type=int, default=500, help="stub transactions per account")
+    parser.add_argument("--stub-latency-ms", type=float, default=20.0, help="mean stub upstream latency")
+    parser.add_argument("--stub-jitter-ms", type=float, default=5.0, help="+/- stub latency jitter")
+    parser.add_argument("--only", nargs="*", help="run only these scenarios")
+    parser.add_argument("--api-url", help="drive an already running API instead of starting one")
+    parser.add_argument("--save-baseline", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against this JSON file")
+    parser.add_argument("--threshold", type=float, default=0.15, help="allowed p95/throughput change (fraction)")
+    args = parser.parse_args()
+
+    missing = uncovered_routes()
+    if missing:
+        print(f"warning: no scenario for {', '.join(missing)}")
+
+    processes = []
+    api_url = args.api_url
+    if api_url is None:
+        api_url, processes = start_servers(args)
+    try:
+        results = asyncio.run(run_all(api_url, args))
+    finally:
+        stop_servers(processes)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump({"settings": {k: v for k, v in vars(args).items() if k not in ("baseline", "save_baseline")},
+                       "results": results}, f, indent=2)
+        print(f"\nbaseline written to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
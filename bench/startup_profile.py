@@ -0,0 +1,105 @@
+"""Cold-start profile: import cost per module and time until the app answers /health.
+
+Run from the repository root:
+
+    python -m bench.startup_profile --top 25
+
+Each measurement runs in a fresh interpreter so nothing is already imported.
+Background loads that would reach Supabase or the gateway are switched off.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+# Child process: import the app, run the lifespan startup and answer one /health request
+_STARTUP_SCRIPT = """
+import time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(main.app) as client:
+    ready = time.perf_counter()
+    client.get("/health")
+    answered = time.perf_counter()
+print(f"{imported - started} {main.app.state.startup_seconds} {answered - ready}")
+"""
+
+_QUIET_ENV = {
+    "AGGREGATES_LOAD_ON_STARTUP": "false",
+    "CUSTOMER_INDEX_ENABLED": "false",
+    "OFFERS_REFRESH_INTERVAL": "3600",
+    "HTTP_WARM_CONNECTIONS": "0",
+}
+
+
+def _env():
+    env = dict(os.environ)
+    for key, value in _QUIET_ENV.items():
+        env.setdefault(key, value)
+    return env
+
+
+def import_times(module: str):
+    """Parse `python -X importtime` into (cumulative_us, self_us, module) rows"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=_env(), check=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        try:
+            self_us, cumulative_us = int(parts[0]), int(parts[1])
+        except ValueError:
+            # Header line
+            continue
+        rows.append((cumulative_us, self_us, parts[2].strip()))
+    return rows
+
+
+def startup_times(runs: int):
+    """Wall-clock import, lifespan startup and first-request latency, one fresh process per run"""
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-c", _STARTUP_SCRIPT],
+            capture_output=True, text=True, env=_env(), check=True
+        )
+        total = time.perf_counter() - started
+        imported, startup, first_request = (float(v) for v in result.stdout.split()[-3:])
+        samples.append((imported, startup, first_request, total))
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main", help="module to profile (default: main)")
+    parser.add_argument("--top", type=int, default=20, help="slowest imports to list")
+    parser.add_argument("--runs", type=int, default=3, help="fresh-process startup runs")
+    args = parser.parse_args()
+
+    rows = import_times(args.module)
+    local = {name[:-3] for name in os.listdir(".") if name.endswith(".py")}
+    total_us = next((cumulative for cumulative, _, name in rows if name == args.module), 0)
+    print(f"import {args.module}: {total_us / 1000:.1f} ms cumulative")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for cumulative_us, self_us, name in sorted(rows, reverse=True)[:args.top]:
+        marker = "*" if name.strip().split(".")[0] in local else " "
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f} {marker}{name}")
+    print("(* = module from this repository)")
+
+    print()
+    samples = startup_times(args.runs)
+    for label, index in (("import", 0), ("lifespan startup", 1), ("first /health", 2), ("process total", 3)):
+        values = sorted(sample[index] * 1000 for sample in samples)
+        print(f"{label:>17}: median {values[len(values) // 2]:8.1f} ms  (min {values[0]:.1f}, max {values[-1]:.1f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""Local stand-ins for the webMethods gateway (Accounts, Offers, PIS) and Supabase's PostgREST API.
+
+Run from the repository root:
+
+    python -m bench.stub_upstreams --port 9100 --latency-ms 20 --accounts 25
+
+then start the API against it:
+
+    GATEWAY_BASE_URL=http://127.0.0.1:9100 SUPABASE_URL=http://127.0.0.1:9100 uvicorn main:app
+
+Responses mimic the shapes the API reads; latency and payload sizes are configurable.
+"""
+import argparse
+import asyncio
+import bisect
+import gzip
+import hashlib
+import json
+import random
+import re
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import FastAPI, Request, Response
+
+_QUOTED = r'"((?:[^"\\]|\\.)*)"'
+_KEYSET_OR = re.compile(
+    rf'^\(customer_id\.gt\.{_QUOTED},and\(customer_id\.eq\.{_QUOTED},account_id\.gt\.{_QUOTED}\)\)$'
+)
+_CUSTOMER_AFTER_OR = re.compile(rf'^\(customer_id\.gt\.{_QUOTED}\)$')
+
+
+def _unquote(value: str) -> str:
+    return re.sub(r'\\(.)', r'\1', value)
+
+
+@dataclass
+class StubConfig:
+    latency_ms: float = 20.0
+    jitter_ms: float = 5.0
+    accounts: int = 25
+    transactions: int = 500
+    offers: int = 10
+    padding: int = 0
+
+
+def _json(data, status_code: int = 200, headers: Optional[Dict[str, str]] = None) -> Response:
+    return Response(json.dumps(data), status_code=status_code, media_type="application/json", headers=headers)
+
+
+class AccountsTable:
+    """In-memory PostgREST `Accounts` table kept sorted on (customer_id, account_id)"""
+
+    def __init__(self):
+        self.keys: List[Tuple[str, str]] = []
+        self.rows: Dict[Tuple[str, str], Dict] = {}
+
+    def upsert(self, rows: List[Dict]):
+        for row in rows:
+            key = (str(row.get("customer_id")), str(row.get("account_id")))
+            if key not in self.rows:
+                bisect.insort(self.keys, key)
+            self.rows[key] = row
+
+    def select(self, params) -> List[Dict]:
+        start = 0
+        customer_filter = params.get("customer_id", "")
+        keyset = _KEYSET_OR.match(params.get("or", ""))
+        customer_after = _CUSTOMER_AFTER_OR.match(params.get("or", ""))
+        if keyset:
+            start = bisect.bisect_right(self.keys, (_unquote(keyset.group(2)), _unquote(keyset.group(3))))
+        elif customer_after:
+            start = bisect.bisect_right(self.keys, (_unquote(customer_after.group(1)), "\uffff"))
+        elif customer_filter.startswith("gt."):
+            start = bisect.bisect_right(self.keys, (customer_filter[3:], "\uffff"))
+        elif customer_filter.startswith("eq."):
+            start = bisect.bisect_left(self.keys, (customer_filter[3:], ""))
+        customer_in = None
+        if customer_filter.startswith("in.("):
+            customer_in = {_unquote(value) for value in re.findall(_QUOTED, customer_filter)}
+        limit = int(params.get("limit", "1000"))
+        out = []
+        for key in self.keys[start:]:
+            if customer_filter.startswith("eq.") and key[0] != customer_filter[3:]:
+                break
+            if customer_in is not None and key[0] not in customer_in:
+                continue
+            out.append(self.rows[key])
+            if len(out) >= limit:
+                break
+        return _project(out, params.get("select", "*"))
+
+
+def _project(rows: List[Dict], select: str) -> List[Dict]:
+    if select == "*":
+        return rows
+    columns = select.split(",")
+    return [{column: row.get(column) for column in columns} for row in rows]
+
+
+def _transactions(account_id: str, params, config: StubConfig, date_filters: List[str]) -> List[Dict]:
+    """Deterministic transactions 1..N per account, filtered like PostgREST"""
+    after = params.get("id", "gt.0")
+    first_id = int(after[3:]) + 1 if after.startswith("gt.") else 1
+    limit = int(params.get("limit", "100"))
+    seed = int(hashlib.blake2b(account_id.encode(), digest_size=4).hexdigest(), 16)
+    epoch = datetime(2024, 1, 1)
+    out = []
+    for tx_id in range(first_id, config.transactions + 1):
+        created_at = (epoch + timedelta(hours=tx_id * 6)).isoformat()
+        if any(
+            (f.startswith("gte.") and created_at < f[4:]) or (f.startswith("lt.") and created_at >= f[3:])
+            for f in date_filters
+        ):
+            continue
+        out.append({
+            "id": tx_id,
+            "account_id": account_id,
+            "created_at": created_at,
+            "amount": round(((seed + tx_id * 7919) % 100000) / 100, 2),
+            "direction": "credit" if (seed + tx_id) % 3 else "debit",
+            "description": f"Transaction {tx_id}"
+        })
+        if len(out) >= limit:
+            break
+    return _project(out, params.get("select", "*"))
+
+
+def _gateway_accounts(customer_id: str, skip: int, limit: int, config: StubConfig) -> Dict:
+    data = []
+    for i in range(skip, min(skip + limit, config.accounts)):
+        account = {
+            "accountId": f"{customer_id}-ACC-{i:04d}",
+            "customerId": customer_id,
+            "accountStatus": "active" if i % 5 else "dormant",
+            "accountCurrency": "JOD" if i % 4 else "USD",
+            "accountType": "current",
+            "availableBalance": {
+                "balanceAmount": f"{1000 + i * 37.5:.2f}",
+                "balancePosition": "credit" if i % 3 else "debit"
+            },
+            "mainRoute": {"address": f"JO71CBJO{i:022d}", "schema": "IBAN"},
+            "institutionBasicInfo": {"name": {"enName": "Stub Bank", "tradeName": {"enName": f"Stub Bank {i % 3}"}}}
+        }
+        if config.padding:
+            account["padding"] = "x" * config.padding
+        data.append(account)
+    return {"data": data}
+
+
+def create_stub_app(config: StubConfig) -> FastAPI:
+    """One app serving every upstream path the API calls"""
+    app = FastAPI(openapi_url=None)
+    accounts_table = AccountsTable()
+    balances: Dict[str, Dict[str, Dict]] = {}
+    offers = {"data": [{"offerId": f"OFFER-{i}", "title": f"Offer {i}"} for i in range(config.offers)]}
+    offers_etag = '"' + hashlib.md5(json.dumps(offers).encode()).hexdigest() + '"'
+
+    async def delay():
+        latency = config.latency_ms + random.uniform(-config.jitter_ms, config.jitter_ms)
+        if latency > 0:
+            await asyncio.sleep(latency / 1000)
+
+    @app.api_route("/{path:path}", methods=["GET", "POST", "HEAD"])
+    async def upstream(path: str, request: Request):
+        if request.method == "HEAD":
+            return Response()
+        await delay()
+        params = request.query_params
+
+        if path.endswith("/accounts") and "Accounts" in path:
+            customer_id = request.headers.get("x-customer-id", "UNKNOWN")
+            return _json(_gateway_accounts(
+                customer_id, int(params.get("skip", "0")), int(params.get("limit", "10")), config
+            ))
+
+        if "institution/offers" in path:
+            if request.headers.get("if-none-match") == offers_etag:
+                return Response(status_code=304, headers={"ETag": offers_etag})
+            return _json(offers, headers={"ETag": offers_etag})
+
+        if path.endswith("/paymentPlan"):
+            return _json({"paymentPlanId": f"PP-{uuid.uuid4().hex[:12]}"}, status_code=201)
+        if "/paymentPlan/" in path and path.endswith("/blocks"):
+            return _json([{
+                "blockId": f"BLOCK-{uuid.uuid4().hex[:8]}",
+                "blockPaymentAmount": {"amount": "10.00", "currency": "JOD"},
+                "totalResult": "PASS"
+            }])
+        if path.endswith("/PIS/initiation"):
+            return _json({"status": "ACCP", "transactionId": f"TXN-{uuid.uuid4().hex[:12]}"}, status_code=201)
+
+        if path == "rest/v1/Accounts":
+            if request.method == "POST":
+                body = await request.body()
+                if request.headers.get("content-encoding") == "gzip":
+                    body = gzip.decompress(body)
+                accounts_table.upsert(json.loads(body))
+                return Response(status_code=201)
+            return _json(accounts_table.select(params))
+
+        if path == "rest/v1/account_balances":
+            if request.method == "POST":
+                body = await request.body()
+                if request.headers.get("content-encoding") == "gzip":
+                    body = gzip.decompress(body)
+                for row in json.loads(body):
+                    balances.setdefault(row["account_id"], {})[row["observed_at"]] = row
+                return Response(status_code=201)
+            rows = sorted(balances.get(params.get("account_id", "eq.")[3:], {}).values(), key=lambda r: r["observed_at"])
+            after = params.get("observed_at", "")
+            if after.startswith("gt."):
+                rows = [row for row in rows if row["observed_at"] > after[3:]]
+            return _json(_project(rows[:int(params.get("limit", "1000"))], params.get("select", "*")))
+
+        if path == "rest/v1/Transactions":
+            account_filter = params.get("account_id", "eq.")
+            return _json(_transactions(account_filter[3:], params, config, params.getlist("created_at")))
+
+        return _json({"message": f"no stub for {path}"}, status_code=404)
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="mean added latency per call")
+    parser.add_argument("--jitter-ms", type=float, default=5.0, help="+/- uniform jitter")
+    parser.add_argument("--accounts", type=int, default=25, help="gateway accounts per customer")
+    parser.add_argument("--transactions", type=int, default=500, help="transactions per account")
+    parser.add_argument("--offers", type=int, default=10, help="offers in the catalogue")
+    parser.add_argument("--padding", type=int, default=0, help="extra bytes per gateway account")
+    args = parser.parse_args()
+
+    import uvicorn
+    config = StubConfig(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, accounts=args.accounts,
+        transactions=args.transactions, offers=args.offers, padding=args.padding
+    )
+    uvicorn.run(create_stub_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+import asyncio
+import hashlib
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+from supabase_client import postgrest_quote
+
+# Index settings (overridable through the environment)
+CUSTOMER_INDEX_ENABLED = os.getenv("CUSTOMER_INDEX_ENABLED", "true").lower() in ("1", "true", "yes")
+CUSTOMER_INDEX_CAPACITY = int(os.getenv("CUSTOMER_INDEX_CAPACITY", "1000000"))
+CUSTOMER_INDEX_FP_RATE = float(os.getenv("CUSTOMER_INDEX_FP_RATE", "0.01"))
+CUSTOMER_INDEX_PAGE_SIZE = int(os.getenv("CUSTOMER_INDEX_PAGE_SIZE", "1000"))
+CUSTOMER_INDEX_RELOAD_INTERVAL = float(os.getenv("CUSTOMER_INDEX_RELOAD_INTERVAL", "900"))
+CUSTOMER_INDEX_CONFIRMED_SIZE = int(os.getenv("CUSTOMER_INDEX_CONFIRMED_SIZE", "100000"))
+# How long a local answer is trusted: a "no" after the load it came from, a "yes" after it was
+# confirmed. Other workers' writes and deletes are invisible until then (0 always asks the database)
+CUSTOMER_INDEX_NEGATIVE_TTL = float(os.getenv("CUSTOMER_INDEX_NEGATIVE_TTL", "30"))
+
+
+def customers_after(last_id: str) -> Dict[str, str]:
+    """Keyset filter for customer IDs after last_id
+
+    Sent as a logic tree because PostgREST only honours double quotes there.
+    """
+    return {"or": f"(customer_id.gt.{postgrest_quote(last_id)})"}
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter; answers 'definitely absent' or 'possibly present'"""
+
+    def __init__(self, capacity: int, fp_rate: float):
+        capacity = max(capacity, 1)
+        self.capacity = capacity
+        self.fp_rate = fp_rate
+        self.size = max(int(-capacity * math.log(fp_rate) / (math.log(2) ** 2)), 8)
+        self.hash_count = max(int(round(self.size / capacity * math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        # Double hashing: k positions from one 128-bit digest
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hash_count):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, key: str):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class CustomerIndex:
+    """Local membership index of known customer IDs in front of the Accounts table
+
+    Writes by this process are added immediately; writes by other workers only show up after the
+    next reload, so local negatives are trusted for `negative_ttl` seconds after a load, and
+    confirmed customers for the same time after they were confirmed.
+    """
+
+    def __init__(self, capacity: int = CUSTOMER_INDEX_CAPACITY,
+                 fp_rate: float = CUSTOMER_INDEX_FP_RATE,
+                 confirmed_size: int = CUSTOMER_INDEX_CONFIRMED_SIZE,
+                 negative_ttl: float = CUSTOMER_INDEX_NEGATIVE_TTL):
+        self.capacity = capacity
+        self.fp_rate = fp_rate
+        self.negative_ttl = negative_ttl
+        self.confirmed_size = max(confirmed_size, 1)
+        self.bloom = BloomFilter(capacity, fp_rate)
+        # Recently confirmed customers and when, answered without a round trip
+        self.confirmed: "OrderedDict[str, float]" = OrderedDict()
+        self.ready = False
+        self.loaded_at: Optional[float] = None
+        self.load_duration: Optional[float] = None
+        # When the snapshot behind the current filter was started
+        self._snapshot_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._loading = False
+        self._pending: List[str] = []
+        self._task: Optional[asyncio.Task] = None
+        self.local_positives = 0
+        self.local_negatives = 0
+        self.fallthroughs = 0
+
+    def _confirm(self, customer_id: str):
+        self.confirmed[customer_id] = time.monotonic()
+        self.confirmed.move_to_end(customer_id)
+        while len(self.confirmed) > self.confirmed_size:
+            self.confirmed.popitem(last=False)
+
+    def add(self, customer_id: str):
+        """Record a customer written by this process"""
+        if customer_id is None:
+            return
+        if customer_id not in self.bloom:
+            self.bloom.add(customer_id)
+        if self._loading:
+            self._pending.append(customer_id)
+        self._confirm(customer_id)
+
+    def add_many(self, customer_ids: Iterable[str]):
+        """Record every customer in a batch of written rows"""
+        for customer_id in set(customer_ids):
+            self.add(customer_id)
+
+    def confirm(self, customer_id: str):
+        """Remember a customer the database confirmed exists"""
+        self._confirm(customer_id)
+
+    def lookup(self, customer_id: str) -> Optional[bool]:
+        """True/False when the index can answer locally, None if the database must be asked"""
+        now = time.monotonic()
+        confirmed_at = self.confirmed.get(customer_id)
+        if confirmed_at is not None:
+            if now - confirmed_at < self.negative_ttl:
+                self.confirmed.move_to_end(customer_id)
+                self.local_positives += 1
+                return True
+            # Possibly deleted by another writer since; ask the database again
+            del self.confirmed[customer_id]
+        if (self.ready and now - self._snapshot_at < self.negative_ttl
+                and customer_id not in self.bloom):
+            self.local_negatives += 1
+            return False
+        self.fallthroughs += 1
+        return None
+
+    async def load(self, table, page_size: int = CUSTOMER_INDEX_PAGE_SIZE) -> int:
+        """Bulk-load every customer ID from the Accounts table with keyset paging"""
+        started = time.monotonic()
+        self._loading = True
+        self._pending = []
+        try:
+            bloom = BloomFilter(max(self.capacity, self.bloom.count * 2), self.fp_rate)
+            last_id = None
+            while True:
+                params = {"order": "customer_id.asc", "limit": str(page_size)}
+                if last_id is not None:
+                    params.update(customers_after(last_id))
+                rows = (await table.select("customer_id", params).execute_async()).data
+                for row in rows:
+                    customer_id = row.get("customer_id")
+                    # Rows are per account; consecutive duplicates are the same customer
+                    if customer_id is not None and customer_id != last_id:
+                        bloom.add(customer_id)
+                        last_id = customer_id
+                if len(rows) < page_size:
+                    break
+
+            # Keep writes that landed while the load was running
+            for customer_id in self._pending:
+                if customer_id not in bloom:
+                    bloom.add(customer_id)
+            self.bloom = bloom
+            self.ready = True
+            self._snapshot_at = started
+            self.loaded_at = time.time()
+            self.last_error = None
+            return bloom.count
+        except Exception as e:
+            self.last_error = str(e)
+            raise
+        finally:
+            self._loading = False
+            self._pending = []
+            self.load_duration = time.monotonic() - started
+
+    async def _run(self, table, reload_interval: float):
+        """Initial load plus periodic reloads to pick up writes from other workers"""
+        while True:
+            try:
+                await self.load(table)
+            except Exception:
+                pass
+            await asyncio.sleep(reload_interval)
+
+    def start(self, table, reload_interval: float = CUSTOMER_INDEX_RELOAD_INTERVAL):
+        """Start loading the index in the background"""
+        if CUSTOMER_INDEX_ENABLED and (self._task is None or self._task.done()):
+            self._task = asyncio.ensure_future(self._run(table, reload_interval))
+
+    async def stop(self):
+        """Stop the background loader"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Index size and hit counters"""
+        return {
+            "enabled": CUSTOMER_INDEX_ENABLED,
+            "ready": self.ready,
+            "customers": self.bloom.count,
+            "bloom_bytes": len(self.bloom.bits),
+            "bloom_hashes": self.bloom.hash_count,
+            "negative_ttl_seconds": self.negative_ttl,
+            "confirmed_cached": len(self.confirmed),
+            "loaded_at": self.loaded_at,
+            "load_duration_seconds": self.load_duration,
+            "last_error": self.last_error,
+            "local_positives": self.local_positives,
+            "local_negatives": self.local_negatives,
+            "fallthroughs": self.fallthroughs
+        }
+
+
+# Global customer membership index
+customer_index = CustomerIndex()
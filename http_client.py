@@ -0,0 +1,159 @@
+import asyncio
+import os
+import threading
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Upstream hosts (overridable to point at local stand-ins, see bench/stub_upstreams.py)
+GATEWAY_BASE_URL = os.getenv("GATEWAY_BASE_URL", "https://jpcjofsdev.apigw-az-eu.webmethods.io")
+SUPABASE_BASE_URL = os.getenv("SUPABASE_URL", "https://eruinevvxatdagfqlzwn.supabase.co")
+
+# Pool and timeout settings (overridable through the environment)
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "4"))
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "32"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))
+HTTP_WARM_CONNECTIONS = int(os.getenv("HTTP_WARM_CONNECTIONS", "2"))
+
+# Async client settings
+HTTP_ASYNC_MAX_CONNECTIONS = int(os.getenv("HTTP_ASYNC_MAX_CONNECTIONS", "500"))
+HTTP_ASYNC_MAX_KEEPALIVE = int(os.getenv("HTTP_ASYNC_MAX_KEEPALIVE", "100"))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "true").lower() in ("1", "true", "yes")
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter that applies a default (connect, read) timeout to every request"""
+
+    def __init__(self, timeout=None, **kwargs):
+        self.timeout = timeout or (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().send(request, **kwargs)
+
+
+class HTTPClientPool:
+    """Process-wide keep-alive sessions, one per upstream host"""
+
+    def __init__(self, pool_connections: int = HTTP_POOL_CONNECTIONS,
+                 pool_maxsize: int = HTTP_POOL_MAXSIZE,
+                 timeout: Optional[tuple] = None):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.timeout = timeout or (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+        self._sessions: Dict[str, requests.Session] = {}
+        self._lock = threading.Lock()
+
+    def _new_session(self) -> requests.Session:
+        """Build a session whose adapter keeps up to pool_maxsize idle connections"""
+        session = requests.Session()
+        adapter = TimeoutHTTPAdapter(
+            timeout=self.timeout,
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            pool_block=False
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def get_session(self, url: str) -> requests.Session:
+        """Get the shared session for the host serving the given URL"""
+        host = urlsplit(url).netloc
+        session = self._sessions.get(host)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(host)
+                if session is None:
+                    session = self._new_session()
+                    self._sessions[host] = session
+        return session
+
+    def close(self):
+        """Close every pooled connection"""
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+
+# Global client pool shared by the gateway and Supabase callers
+http_pool = HTTPClientPool()
+
+
+def get_session(url: str) -> requests.Session:
+    """Get the pooled session for a URL"""
+    return http_pool.get_session(url)
+
+
+class AsyncHTTPClientPool:
+    """Process-wide async client (HTTP/2 where the server negotiates it)"""
+
+    def __init__(self, max_connections: int = HTTP_ASYNC_MAX_CONNECTIONS,
+                 max_keepalive: int = HTTP_ASYNC_MAX_KEEPALIVE,
+                 http2: bool = HTTP2_ENABLED):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive
+        )
+        self.timeout = httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+        self.http2 = http2
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def get_client(self) -> httpx.AsyncClient:
+        """Get the shared async client, creating it on first use"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                http2=self.http2,
+                limits=self.limits,
+                timeout=self.timeout
+            )
+        return self._client
+
+    async def warm_up(self, urls=(GATEWAY_BASE_URL, SUPABASE_BASE_URL),
+                      connections: int = HTTP_WARM_CONNECTIONS) -> Dict[str, bool]:
+        """Open `connections` keep-alive connections per upstream host ahead of the first request"""
+        client = self.get_client()
+
+        async def touch(url):
+            try:
+                # Any response (even 4xx) leaves a reusable connection in the pool
+                await client.head(url)
+                return True
+            except httpx.HTTPError:
+                return False
+
+        # Concurrent requests so each one opens its own connection (HTTP/1.1) or stream (HTTP/2)
+        targets = [url for url in urls for _ in range(max(connections, 0))]
+        outcomes = await asyncio.gather(*(touch(url) for url in targets))
+
+        results: Dict[str, bool] = {}
+        for url, ok in zip(targets, outcomes):
+            host = urlsplit(url).netloc
+            results[host] = results.get(host, True) and ok
+        return results
+
+    async def close(self):
+        """Close the async client and its connections"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+# Global async client shared by the async endpoints
+async_http_pool = AsyncHTTPClientPool()
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Get the pooled async client"""
+    return async_http_pool.get_client()
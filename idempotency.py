@@ -0,0 +1,199 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+# Idempotency settings (overridable through the environment)
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", "86400"))
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "100000"))
+# Set to a file path to keep stored results across restarts
+IDEMPOTENCY_SQLITE_PATH = os.getenv("IDEMPOTENCY_SQLITE_PATH", "")
+
+
+class IdempotencyKeyConflict(Exception):
+    """Raised when a key is reused with different request parameters"""
+
+
+class _SQLiteBackend:
+    """Durable copy of completed results, one row per (scope, key)"""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS idempotency ("
+                "scope TEXT NOT NULL, key TEXT NOT NULL, fingerprint TEXT NOT NULL, "
+                "result TEXT NOT NULL, expires_at REAL NOT NULL, PRIMARY KEY (scope, key))"
+            )
+
+    def get(self, scope: str, key: str) -> Optional[Tuple[str, Any, float]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT fingerprint, result, expires_at FROM idempotency "
+                "WHERE scope = ? AND key = ? AND expires_at > ?",
+                (scope, key, time.time())
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1]), row[2]
+
+    def put(self, scope: str, key: str, fingerprint: str, result: Any, expires_at: float):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO idempotency VALUES (?, ?, ?, ?, ?)",
+                (scope, key, fingerprint, json.dumps(result), expires_at)
+            )
+            self._conn.execute("DELETE FROM idempotency WHERE expires_at <= ?", (time.time(),))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class IdempotencyStore:
+    """Bounded TTL store of completed responses keyed on client idempotency keys"""
+
+    def __init__(self, ttl: float = IDEMPOTENCY_TTL,
+                 max_entries: int = IDEMPOTENCY_MAX_ENTRIES,
+                 sqlite_path: str = IDEMPOTENCY_SQLITE_PATH):
+        self.ttl = ttl
+        self.max_entries = max(max_entries, 1)
+        self.sqlite_path = sqlite_path
+        # (scope, key) -> (fingerprint, result, expires_at wall-clock time)
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[str, Any, float]]" = OrderedDict()
+        self._in_flight: Dict[Tuple[str, str], Tuple[str, asyncio.Future]] = {}
+        self._backend: Optional[_SQLiteBackend] = None
+        self.replays = 0
+        self.joined = 0
+        self.executions = 0
+        self.conflicts = 0
+        self.evictions = 0
+        self.last_error: Optional[str] = None
+
+    def _durable(self) -> Optional[_SQLiteBackend]:
+        # Opened on first use so importing the module never touches the disk
+        if self.sqlite_path and self._backend is None:
+            self._backend = _SQLiteBackend(self.sqlite_path)
+        return self._backend
+
+    @staticmethod
+    def fingerprint(params: Dict[str, Any]) -> str:
+        """Stable digest of the request parameters a key was first used with"""
+        return json.dumps(params, sort_keys=True, default=str)
+
+    def _remember(self, entry_key: Tuple[str, str], fingerprint: str, result: Any, expires_at: float):
+        self._entries[entry_key] = (fingerprint, result, expires_at)
+        self._entries.move_to_end(entry_key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _cached(self, entry_key: Tuple[str, str]) -> Optional[Tuple[str, Any, float]]:
+        entry = self._entries.get(entry_key)
+        if entry is not None:
+            if entry[2] > time.time():
+                self._entries.move_to_end(entry_key)
+                return entry
+            del self._entries[entry_key]
+        return None
+
+    async def _load(self, entry_key: Tuple[str, str]) -> Optional[Tuple[str, Any, float]]:
+        backend = self._durable()
+        if backend is None:
+            return None
+        loop = asyncio.get_running_loop()
+        entry = await loop.run_in_executor(None, backend.get, *entry_key)
+        if entry is not None:
+            self._remember(entry_key, *entry)
+        return entry
+
+    def _check(self, key: str, stored_fingerprint: str, fingerprint: str):
+        if stored_fingerprint != fingerprint:
+            self.conflicts += 1
+            raise IdempotencyKeyConflict(f"Idempotency key {key!r} was already used with different parameters")
+
+    async def run(self, scope: str, key: str, params: Dict[str, Any],
+                  call: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Return (result, replayed); only the first request for a key reaches the upstream"""
+        entry_key = (scope, key)
+        fingerprint = self.fingerprint(params)
+
+        in_flight = self._in_flight.get(entry_key)
+        stored = self._cached(entry_key)
+        if stored is None and in_flight is None:
+            stored = await self._load(entry_key)
+            if stored is None:
+                # A duplicate may have started or even finished the call during the read
+                in_flight = self._in_flight.get(entry_key)
+                stored = self._cached(entry_key)
+        if stored is not None:
+            self._check(key, stored[0], fingerprint)
+            self.replays += 1
+            return stored[1], True
+
+        if in_flight is not None:
+            self._check(key, in_flight[0], fingerprint)
+            self.joined += 1
+            # Shielded so a disconnecting duplicate doesn't cancel the original call
+            return await asyncio.shield(in_flight[1]), True
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[entry_key] = (fingerprint, future)
+        self.executions += 1
+        try:
+            result = await call()
+        except BaseException as e:
+            # Failures are not stored, so the client can retry with the same key
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                # Waiters re-raise it; mark it retrieved in case there are none
+                future.exception()
+            raise
+        finally:
+            self._in_flight.pop(entry_key, None)
+
+        expires_at = time.time() + self.ttl
+        self._remember(entry_key, fingerprint, result, expires_at)
+        future.set_result(result)
+        backend = self._durable()
+        if backend is not None:
+            try:
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(None, backend.put, scope, key, fingerprint, result, expires_at)
+            except Exception as e:
+                # The in-memory copy still serves retries on this worker
+                self.last_error = str(e)
+        return result, False
+
+    def close(self):
+        """Close the durable store, if any"""
+        if self._backend is not None:
+            self._backend.close()
+            self._backend = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Replay and conflict counters"""
+        return {
+            "backend": "sqlite" if self.sqlite_path else "memory",
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "in_flight": len(self._in_flight),
+            "executions": self.executions,
+            "replays": self.replays,
+            "joined_in_flight": self.joined,
+            "conflicts": self.conflicts,
+            "evictions": self.evictions,
+            "last_error": self.last_error
+        }
+
+
+# Global store for the payment endpoints
+idempotency_store = IdempotencyStore()
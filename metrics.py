@@ -0,0 +1,172 @@
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# Latency buckets (seconds) spanning cache hits to slow gateway walks
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "API request latency",
+    ["route", "method", "status"], buckets=LATENCY_BUCKETS
+)
+REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "API requests being served")
+RESPONSE_SIZE = Histogram("http_response_size_bytes", "API response body size", ["route"], buckets=SIZE_BUCKETS)
+
+UPSTREAM_LATENCY = Histogram(
+    "upstream_request_duration_seconds", "Latency of calls to the gateway APIs and Supabase",
+    ["upstream", "method", "status"], buckets=LATENCY_BUCKETS
+)
+UPSTREAM_IN_FLIGHT = Gauge("upstream_requests_in_flight", "Upstream calls in progress", ["upstream"])
+UPSTREAM_ERRORS = Counter(
+    "upstream_errors_total", "Failed upstream calls by HTTP status or exception type",
+    ["upstream", "status"]
+)
+UPSTREAM_PAYLOAD_SIZE = Histogram(
+    "upstream_payload_size_bytes", "Upstream request and response body sizes",
+    ["upstream", "direction"], buckets=SIZE_BUCKETS
+)
+
+STAGE_LATENCY = Histogram(
+    "request_stage_duration_seconds", "Time spent per processing stage (decode, extract, storage, ...)",
+    ["stage"], buckets=LATENCY_BUCKETS
+)
+
+# Stage durations (ms) for the request being served; read by the Server-Timing middleware
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+
+def _add_timing(stage: str, seconds: float):
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds * 1000
+
+
+@contextmanager
+def stage(name: str):
+    """Time a processing stage for the stage histogram and the Server-Timing header"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_LATENCY.labels(name).observe(elapsed)
+        _add_timing(name, elapsed)
+
+
+class UpstreamCall:
+    """Records latency, in-flight count, errors and payload sizes for one upstream attempt"""
+    __slots__ = ("upstream", "method", "started", "finished")
+
+    def __init__(self, upstream: str, method: str, request_bytes: int = 0):
+        self.upstream = upstream
+        self.method = method
+        self.started = time.perf_counter()
+        self.finished = False
+        UPSTREAM_IN_FLIGHT.labels(upstream).inc()
+        if request_bytes:
+            UPSTREAM_PAYLOAD_SIZE.labels(upstream, "request").observe(request_bytes)
+
+    def done(self, status_code: int, response_bytes: int = 0):
+        if self.finished:
+            return
+        self.finished = True
+        elapsed = time.perf_counter() - self.started
+        UPSTREAM_IN_FLIGHT.labels(self.upstream).dec()
+        UPSTREAM_LATENCY.labels(self.upstream, self.method, str(status_code)).observe(elapsed)
+        UPSTREAM_PAYLOAD_SIZE.labels(self.upstream, "response").observe(response_bytes)
+        if status_code >= 400:
+            UPSTREAM_ERRORS.labels(self.upstream, str(status_code)).inc()
+        _add_timing(self.upstream, elapsed)
+
+    def failed(self, error: BaseException):
+        if self.finished:
+            return
+        self.finished = True
+        UPSTREAM_IN_FLIGHT.labels(self.upstream).dec()
+        if isinstance(error, asyncio.CancelledError):
+            # Abandoned on purpose (e.g. the losing copy of a hedged request)
+            return
+        elapsed = time.perf_counter() - self.started
+        UPSTREAM_LATENCY.labels(self.upstream, self.method, "error").observe(elapsed)
+        UPSTREAM_ERRORS.labels(self.upstream, type(error).__name__).inc()
+        _add_timing(self.upstream, elapsed)
+
+
+@contextmanager
+def track_upstream(upstream: str, method: str, request_bytes: int = 0):
+    """Wrap one upstream attempt; call .done(status, size) on the yielded call once it answers"""
+    call = UpstreamCall(upstream, method, request_bytes)
+    try:
+        yield call
+    except BaseException as e:
+        call.failed(e)
+        raise
+
+
+def payload_size(content) -> int:
+    """Size of a request body given as bytes or str (0 for anything else)"""
+    return len(content) if isinstance(content, (bytes, bytearray, str)) else 0
+
+
+class MetricsMiddleware:
+    """ASGI middleware: per-route latency/in-flight/size metrics and a Server-Timing header"""
+
+    def __init__(self, app):
+        self.app = app
+        self._route_paths: Dict[object, str] = {}
+
+    def _route(self, scope) -> str:
+        # The router records the matched endpoint in the scope; label by its path template
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        path = self._route_paths.get(endpoint)
+        if path is None:
+            for route in scope["app"].routes:
+                if getattr(route, "endpoint", None) is endpoint:
+                    path = route.path
+                    break
+            path = self._route_paths[endpoint] = path or "unmatched"
+        return path
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings: Dict[str, float] = {}
+        token = _request_timings.set(timings)
+        started = time.perf_counter()
+        state = {"status": 500, "size": 0}
+        REQUESTS_IN_FLIGHT.inc()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+                parts = [f"{name};dur={duration:.1f}" for name, duration in timings.items()]
+                parts.append(f"total;dur={(time.perf_counter() - started) * 1000:.1f}")
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", ", ".join(parts).encode("latin-1")))
+                message = {**message, "headers": headers}
+            elif message["type"] == "http.response.body":
+                state["size"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_timings.reset(token)
+            REQUESTS_IN_FLIGHT.dec()
+            route = self._route(scope)
+            REQUEST_LATENCY.labels(route, scope["method"], str(state["status"])).observe(time.perf_counter() - started)
+            RESPONSE_SIZE.labels(route).observe(state["size"])
+
+
+def render_metrics():
+    """Prometheus text exposition of every registered metric"""
+    return generate_latest(), CONTENT_TYPE_LATEST
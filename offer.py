@@ -1,20 +1,50 @@
-import requests
 import json
 
-def get_offers():
-    url = "https://jpcjofsdev.apigw-az-eu.webmethods.io/gateway/Offers/v0.4.3/institution/offers"
+from http_client import GATEWAY_BASE_URL
+from resilience import offers_upstream
 
-    querystring = {"sort":"desc","limit":"10","skip":"0"}
+OFFERS_URL = f"{GATEWAY_BASE_URL}/gateway/Offers/v0.4.3/institution/offers"
+OFFERS_QUERYSTRING = {"sort":"desc","limit":"10","skip":"0"}
+OFFERS_HEADERS = {
+    "x-idempotency-key": "1",
+    "x-interactions-id": "1",
+    "Authorization": "1",
+    "x-financial-id": "1",
+    "x-jws-signature": "1"
+}
 
-    headers = {
-        "x-idempotency-key": "1",
-        "x-interactions-id": "1",
-        "Authorization": "1",
-        "x-financial-id": "1",
-        "x-jws-signature": "1"
-    }
+def get_offers():
+    url = OFFERS_URL
 
-    response = requests.request("GET", url, headers=headers, params=querystring)
+    response = offers_upstream.request("GET", url, headers=OFFERS_HEADERS, params=OFFERS_QUERYSTRING)
     response_text = response.text
     response_json = json.loads(response_text)
     return response_json
+
+async def get_offers_async():
+    url = OFFERS_URL
+
+    response = await offers_upstream.request_async("GET", url, headers=OFFERS_HEADERS, params=OFFERS_QUERYSTRING)
+    response_json = json.loads(response.text)
+    return response_json
+
+async def get_offers_conditional_async(etag=None, last_modified=None):
+    """Revalidate the offers list; returns (status_code, data, etag, last_modified), data is None on 304"""
+    url = OFFERS_URL
+    headers = dict(OFFERS_HEADERS)
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    response = await offers_upstream.request_async("GET", url, headers=headers, params=OFFERS_QUERYSTRING)
+    if response.status_code == 304:
+        return 304, None, etag, last_modified
+    response.raise_for_status()
+    response_json = json.loads(response.text)
+    return (
+        response.status_code,
+        response_json,
+        response.headers.get("ETag") or None,
+        response.headers.get("Last-Modified") or None
+    )
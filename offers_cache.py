@@ -0,0 +1,112 @@
+import asyncio
+import os
+import time
+from typing import Any, Dict, Optional
+
+from offer import get_offers_conditional_async
+
+# Refresh cadence for the offers catalogue (seconds)
+OFFERS_REFRESH_INTERVAL = float(os.getenv("OFFERS_REFRESH_INTERVAL", "300"))
+
+
+class OffersCache:
+    """In-memory offers catalogue refreshed in the background with conditional requests"""
+
+    def __init__(self, refresh_interval: float = OFFERS_REFRESH_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self.data: Optional[Any] = None
+        self.etag: Optional[str] = None
+        self.last_modified: Optional[str] = None
+        self.fetched_at: Optional[float] = None
+        self.validated_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.version = 0
+        self.refreshes = 0
+        self.not_modified = 0
+        self.refresh_failures = 0
+        # Created on first use so it binds to the serving event loop
+        self._lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def refresh(self, only_if_empty: bool = False) -> bool:
+        """Revalidate against the gateway; keeps the last good copy if the call fails"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            # Another caller may have loaded the catalogue while we waited
+            if only_if_empty and self.data is not None:
+                return True
+            try:
+                status_code, data, etag, last_modified = await get_offers_conditional_async(
+                    etag=self.etag,
+                    last_modified=self.last_modified
+                )
+            except Exception as e:
+                self.refresh_failures += 1
+                self.last_error = str(e)
+                return False
+
+            now = time.time()
+            self.validated_at = now
+            self.last_error = None
+            if status_code == 304 and self.data is not None:
+                self.not_modified += 1
+                return True
+
+            if data is not None:
+                self.data = data
+                self.etag = etag
+                self.last_modified = last_modified
+                self.fetched_at = now
+                self.version += 1
+                self.refreshes += 1
+            return True
+
+    async def get(self) -> Any:
+        """Serve the catalogue from memory, loading it once if nothing is cached yet"""
+        if self.data is None:
+            await self.refresh(only_if_empty=True)
+            if self.data is None:
+                raise Exception(f"Offers are unavailable: {self.last_error}")
+        return self.data
+
+    async def _run(self):
+        """Refresh loop for the background task"""
+        while True:
+            await self.refresh()
+            await asyncio.sleep(self.refresh_interval)
+
+    def start(self):
+        """Start the background refresh task"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """Stop the background refresh task"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Freshness and refresh counters"""
+        return {
+            "cached": self.data is not None,
+            "version": self.version,
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+            "fetched_at": self.fetched_at,
+            "validated_at": self.validated_at,
+            "refresh_interval_seconds": self.refresh_interval,
+            "refreshes": self.refreshes,
+            "not_modified": self.not_modified,
+            "refresh_failures": self.refresh_failures,
+            "last_error": self.last_error
+        }
+
+
+# Global offers catalogue
+offers_cache = OffersCache()
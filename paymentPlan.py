@@ -1,88 +1,239 @@
-import requests
 import json
+import re
+import time
 
+from http_client import GATEWAY_BASE_URL
+from resilience import pis_upstream
+from single_flight import single_flight, flight_key
 
+PIS_BASE_URL = f"{GATEWAY_BASE_URL}/gateway/RFC%20-%20Payment%20Initiation%20Services%20%28PIS%29/v0.4.3"
 
-def paymentplan(ammount, x_customer_id):
-    url = "https://jpcjofsdev.apigw-az-eu.webmethods.io/gateway/RFC%20-%20Payment%20Initiation%20Services%20%28PIS%29/v0.4.3/paymentPlan"
-    payload = {
-        "accounts": [
-            {
-                "accountAgentParty": "cdtrAgt",
-                "accountType": "cdtrAcct",
-                "mainRoute": {
-                    "address": "IND_CUST_001",
-                    "schema": "qMybXYjHb"
-                }
+
+def _field(name):
+    """Placeholder for a value patched into a payload template"""
+    return f"@@{name}@@"
+
+
+class PayloadTemplate:
+    """Payload serialised once; render() only splices the variable fields in"""
+    _placeholder = re.compile(r'"@@(\w+)@@"')
+
+    def __init__(self, payload):
+        encoded = json.dumps(payload, separators=(",", ":"))
+        parts = self._placeholder.split(encoded)
+        # Alternating literal segments and field names
+        self.segments = [part.encode("utf-8") for part in parts[0::2]]
+        self.fields = parts[1::2]
+
+    def render(self, **values) -> bytes:
+        out = [self.segments[0]]
+        for name, segment in zip(self.fields, self.segments[1:]):
+            out.append(json.dumps(values[name]).encode("utf-8"))
+            out.append(segment)
+        return b"".join(out)
+
+
+PAYMENT_PLAN_TEMPLATE = PayloadTemplate({
+    "accounts": [
+        {
+            "accountAgentParty": "cdtrAgt",
+            "accountType": "cdtrAcct",
+            "mainRoute": {
+                "address": "IND_CUST_001",
+                "schema": "qMybXYjHb"
             }
-        ],
-        "agents": [
-            {
-                "agent": {
-                    "additionalInfo": [
-                        {"key": "OaUFAGx",
-                        "value": "A"}
-                    ],
-                    "address": {
-                        "addresslines": [],
-                        "city": "gWqeQamMHNJ",
-                        "countryInfo": {
-                            "countryCode": "JO",
-                            "countryName": "pWj"
-                        },
-                        "postcode": "CneUkNcesBr",
-                        "state": "OhiQgqyAVbUa"
+        }
+    ],
+    "agents": [
+        {
+            "agent": {
+                "additionalInfo": [
+                    {"key": "OaUFAGx",
+                    "value": "A"}
+                ],
+                "address": {
+                    "addresslines": [],
+                    "city": "gWqeQamMHNJ",
+                    "countryInfo": {
+                        "countryCode": "JO",
+                        "countryName": "pWj"
                     },
-                    "agentIdentification": {
-                        "address": "IND_CUST_001",
-                        "schema": "DJWo"
+                    "postcode": "CneUkNcesBr",
+                    "state": "OhiQgqyAVbUa"
+                },
+                "agentIdentification": {
+                    "address": "IND_CUST_001",
+                    "schema": "DJWo"
+                },
+                "enName": "ktIFvEjyWPeC"
+            },
+            "agentType": "cdtrAgt"
+        }
+    ],
+    "endToEnd": "bphscaOo",
+    "involvedParties": [
+        {
+            "involvedParty": {
+                "additionalInfo": [
+                    {
+                        "key": "VKVEOoSJNoP",
+                        "value": "KlPvFhfAfS"
+                    }
+                ],
+                "address": {
+                    "addresslines": [],
+                    "city": "YbJSHjoRwM",
+                    "countryInfo": {
+                        "countryCode": "JO",
+                        "countryName": "msLElEQpr"
                     },
-                    "enName": "ktIFvEjyWPeC"
+                    "postcode": "wAtBS",
+                    "state": "uDKHhddmXUgS"
                 },
-                "agentType": "cdtrAgt"
-            }
-        ],
-        "endToEnd": "bphscaOo",
-        "involvedParties": [
-            {
-                "involvedParty": {
-                    "additionalInfo": [
-                        {
-                            "key": "VKVEOoSJNoP",
-                            "value": "KlPvFhfAfS"
-                        }
-                    ],
-                    "address": {
-                        "addresslines": [],
-                        "city": "YbJSHjoRwM",
-                        "countryInfo": {
-                            "countryCode": "JO",
-                            "countryName": "msLElEQpr"
+                "enName": "QftUXRmQjnpGDe"
+            },
+            "involvedPartyType": "cdtr"
+        }
+    ],
+    "paymentDetails": {
+        "expirationDate": "2025-07-18",
+        "frequency": "pqcA",
+        "recurringPaymentAmount": {
+            "amount": _field("amount"),
+            "currency": "JOR"
+        },
+        "rmtInf": "deQgulPTWmxC",
+        "setAmount": {
+            "amount": _field("amount"),
+            "currency": "JOR"
+        },
+        "setNumberOfPayments": 1467098562
+    },
+    "paymentPlanAuthPurposeCode": "ICv"
+})
+
+INITIATE_PAYMENT_TEMPLATE = PayloadTemplate({
+    "groupHeader": {
+        "batchBooking": "ortnDSVNBr",
+        "batchPurpose": "kLtAdesqiNxcgv",
+        "creationDateTime": "2025-07-18",
+        "numberOfTrx": "OTvhSBY",
+        "paymentMethod": "oS",
+        "totalTrxAmount": {
+            "amount": _field("amount"),
+            "currency": "JOD"
+        }
+    },
+    "instructionsInfo": [
+        {
+            "accounts": [
+                {
+                    "accountAgentParty": "InitgPty",
+                    "accountType": "cdtrAcct",
+                    "mainRoute": {
+                        "address": "mJBGMcsSrr",
+                        "schema": "FuUKMmnIcAOHe"
+                    }
+                }
+            ],
+            "agents": [
+                {
+                    "agent": {
+                        "additionalInfo": [
+                            {
+                                "key": "EoRMXdNlE",
+                                "value": "XWghUo"
+                            }
+                        ],
+                        "address": {
+                            "addresslines": [],
+                            "city": "lO",
+                            "countryInfo": {
+                                "countryCode": "JO",
+                                "countryName": "vuCwu"
+                            },
+                            "postcode": "lCrfWOxKg",
+                            "state": "cgjPPWYkQei"
                         },
-                        "postcode": "wAtBS",
-                        "state": "uDKHhddmXUgS"
+                        "agentIdentification": {
+                            "address": "vEGbDTQaKa",
+                            "schema": "MpjupA"
+                        },
+                        "enName": "tMOiNijfc"
                     },
-                    "enName": "QftUXRmQjnpGDe"
-                },
-                "involvedPartyType": "cdtr"
-            }
-        ],
-        "paymentDetails": {
-            "expirationDate": "2025-07-18",
-            "frequency": "pqcA",
-            "recurringPaymentAmount": {
-                "amount": ammount,
-                "currency": "JOR"
+                    "agentType": "cdtrAgt"
+                }
+            ],
+            "categoryPurpose": "lKKlVheQqSE",
+            "clearingChannel": "RTGS",
+            "identifications": {
+                "SOSPId": "g",
+                "blockId": _field("block_id"),
+                "endToEnd": "hoJFVwFmNEsaAt",
+                "fxQuoteId": "vbnBkpdbBVQuvE",
+                "paymentPlanId": _field("payment_plan_id"),
+                "quoteId": "KhfhVTAKPwF",
+                "trxId": "IOoiGjhlTf"
             },
-            "rmtInf": "deQgulPTWmxC",
-            "setAmount": {
-                "amount": ammount,
-                "currency": "JOR"
+            "involvedParties": [
+                {
+                    "involvedParty": {
+                        "additionalInfo": [
+                            {
+                                "key": "tPoxqBfcvyFj",
+                                "value": "YRkKikfloUTYDb"
+                            }
+                        ],
+                        "address": {
+                            "addresslines": [],
+                            "city": "NwTWoXQlv",
+                            "countryInfo": {
+                                "countryCode": "JO",
+                                "countryName": "BwmLHaL"
+                            },
+                            "postcode": "UQM",
+                            "state": "igskxkkOJjS"
+                        },
+                        "enName": "o"
+                    },
+                    "involvedPartyType": "ultmtCdtr"
+                }
+            ],
+            "localInstrument": "sOjUxWT",
+            "regulatoryReporting": [],
+            "remittanceInformation": {
+                "unstructured": []
             },
-            "setNumberOfPayments": 1467098562
-        },
-        "paymentPlanAuthPurposeCode": "ICv"
-    }
+            "serviceLevel": "vlsIEaFDJIhJM",
+            "supplementaryData": [
+                {
+                    "key": "neSwHkYkvl",
+                    "value": "AScqVdWASna"
+                }
+            ],
+            "trxAmount": {
+                "amount": _field("amount"),
+                "currency": "JOD"
+            },
+            "trxPresDateTime": "2025-07-18"
+        }
+    ]
+})
+
+
+def _retry_safe(idempotency_key):
+    """POSTs are only retried when the client supplied a real idempotency key"""
+    return idempotency_key != "1"
+
+def _stage_key(idempotency_key, stage):
+    """Per-stage gateway key derived from the client key, so stages never share one"""
+    if idempotency_key == "1":
+        return idempotency_key
+    return f"{idempotency_key}:{stage}"
+
+def _payment_plan_request(ammount, x_customer_id, idempotency_key="1"):
+    url = f"{PIS_BASE_URL}/paymentPlan"
+    payload = PAYMENT_PLAN_TEMPLATE.render(amount=ammount)
     headers = {
         "x-financial-id": "1",
         "x-customer-user-agent": "1",
@@ -92,18 +243,32 @@ def paymentplan(ammount, x_customer_id):
         "x-customer-ip-address": "1",
         "x-jws-signature": "1",
         "x-auth-date": "1",
-        "x-idempotency-key": "1",
+        "x-idempotency-key": f"{idempotency_key}",
         "content-type": "application/json"
     }
 
-    response = requests.request("POST", url, json=payload, headers=headers)
-    response_text = response.text
-    data = json.loads(response_text)
+    return url, payload, headers
+
+def _parse_payment_plan(response):
+    # Raising (rather than returning the error body) keeps failures out of the idempotency store
+    if response.status_code >= 400:
+        raise Exception(f"Error creating payment plan: {response.status_code} - {response.text}")
+    data = json.loads(response.text)
     #payment_plan_id = data['paymentPlanId']
     return data
 
-def get_payment_plan_blocks(payment_plan_id, x_customer_id):
-    url = f"https://jpcjofsdev.apigw-az-eu.webmethods.io/gateway/RFC%20-%20Payment%20Initiation%20Services%20%28PIS%29/v0.4.3/paymentPlan/{payment_plan_id}/blocks"
+def paymentplan(ammount, x_customer_id, idempotency_key="1"):
+    url, payload, headers = _payment_plan_request(ammount, x_customer_id, idempotency_key)
+    response = pis_upstream.request("POST", url, data=payload, headers=headers, idempotent=_retry_safe(idempotency_key))
+    return _parse_payment_plan(response)
+
+async def paymentplan_async(ammount, x_customer_id, idempotency_key="1"):
+    url, payload, headers = _payment_plan_request(ammount, x_customer_id, idempotency_key)
+    response = await pis_upstream.request_async("POST", url, content=payload, headers=headers, idempotent=_retry_safe(idempotency_key))
+    return _parse_payment_plan(response)
+
+def _payment_plan_blocks_request(payment_plan_id, x_customer_id):
+    url = f"{PIS_BASE_URL}/paymentPlan/{payment_plan_id}/blocks"
 
     headers = {
         "x-idempotency-key": "1",
@@ -117,7 +282,9 @@ def get_payment_plan_blocks(payment_plan_id, x_customer_id):
         "x-financial-id": "1"
     }
 
-    response = requests.request("GET", url, headers=headers)
+    return url, headers
+
+def _parse_payment_plan_blocks(response):
     if response.status_code != 200:
         raise Exception(f"Error fetching payment plan blocks: {response.status_code} - {response.text}")
     if len(response.text) > 20 :
@@ -143,132 +310,113 @@ def get_payment_plan_blocks(payment_plan_id, x_customer_id):
     #print(blockId)
     return data_block
 
-def initiate_payment(payment_plan_id, blockId, ammount, x_customer_id):
-    url = "https://jpcjofsdev.apigw-az-eu.webmethods.io/gateway/RFC%20-%20Payment%20Initiation%20Services%20%28PIS%29/v0.4.3/PIS/initiation"
-
-    payload = {
-        "groupHeader": {
-            "batchBooking": "ortnDSVNBr",
-            "batchPurpose": "kLtAdesqiNxcgv",
-            "creationDateTime": "2025-07-18",
-            "numberOfTrx": "OTvhSBY",
-            "paymentMethod": "oS",
-            "totalTrxAmount": {
-                "amount": ammount,
-                "currency": "JOD"
-            }
-        },
-        "instructionsInfo": [
-            {
-                "accounts": [
-                    {
-                        "accountAgentParty": "InitgPty",
-                        "accountType": "cdtrAcct",
-                        "mainRoute": {
-                            "address": "mJBGMcsSrr",
-                            "schema": "FuUKMmnIcAOHe"
-                        }
-                    }
-                ],
-                "agents": [
-                    {
-                        "agent": {
-                            "additionalInfo": [
-                                {
-                                    "key": "EoRMXdNlE",
-                                    "value": "XWghUo"
-                                }
-                            ],
-                            "address": {
-                                "addresslines": [],
-                                "city": "lO",
-                                "countryInfo": {
-                                    "countryCode": "JO",
-                                    "countryName": "vuCwu"
-                                },
-                                "postcode": "lCrfWOxKg",
-                                "state": "cgjPPWYkQei"
-                            },
-                            "agentIdentification": {
-                                "address": "vEGbDTQaKa",
-                                "schema": "MpjupA"
-                            },
-                            "enName": "tMOiNijfc"
-                        },
-                        "agentType": "cdtrAgt"
-                    }
-                ],
-                "categoryPurpose": "lKKlVheQqSE",
-                "clearingChannel": "RTGS",
-                "identifications": {
-                    "SOSPId": "g",
-                    "blockId": blockId,
-                    "endToEnd": "hoJFVwFmNEsaAt",
-                    "fxQuoteId": "vbnBkpdbBVQuvE",
-                    "paymentPlanId": payment_plan_id,
-                    "quoteId": "KhfhVTAKPwF",
-                    "trxId": "IOoiGjhlTf"
-                },
-                "involvedParties": [
-                    {
-                        "involvedParty": {
-                            "additionalInfo": [
-                                {
-                                    "key": "tPoxqBfcvyFj",
-                                    "value": "YRkKikfloUTYDb"
-                                }
-                            ],
-                            "address": {
-                                "addresslines": [],
-                                "city": "NwTWoXQlv",
-                                "countryInfo": {
-                                    "countryCode": "JO",
-                                    "countryName": "BwmLHaL"
-                                },
-                                "postcode": "UQM",
-                                "state": "igskxkkOJjS"
-                            },
-                            "enName": "o"
-                        },
-                        "involvedPartyType": "ultmtCdtr"
-                    }
-                ],
-                "localInstrument": "sOjUxWT",
-                "regulatoryReporting": [],
-                "remittanceInformation": {
-                    "unstructured": []
-                },
-                "serviceLevel": "vlsIEaFDJIhJM",
-                "supplementaryData": [
-                    {
-                        "key": "neSwHkYkvl",
-                        "value": "AScqVdWASna"
-                    }
-                ],
-                "trxAmount": {
-                    "amount": ammount,
-                    "currency": "JOD"
-                },
-                "trxPresDateTime": "2025-07-18"
-            }
-        ]
-    }
+def get_payment_plan_blocks(payment_plan_id, x_customer_id):
+    url, headers = _payment_plan_blocks_request(payment_plan_id, x_customer_id)
+    response = pis_upstream.request("GET", url, headers=headers)
+    return _parse_payment_plan_blocks(response)
+
+async def get_payment_plan_blocks_async(payment_plan_id, x_customer_id):
+    async def fetch():
+        url, headers = _payment_plan_blocks_request(payment_plan_id, x_customer_id)
+        response = await pis_upstream.request_async("GET", url, headers=headers)
+        return _parse_payment_plan_blocks(response)
+
+    # Repeated lookups of the same plan share one gateway call
+    return await single_flight.do(
+        flight_key("pis.blocks", x_customer_id, payment_plan_id=payment_plan_id), fetch
+    )
+
+def _initiate_payment_request(payment_plan_id, blockId, ammount, x_customer_id, idempotency_key="1"):
+    url = f"{PIS_BASE_URL}/PIS/initiation"
+    payload = INITIATE_PAYMENT_TEMPLATE.render(
+        amount=ammount,
+        block_id=blockId,
+        payment_plan_id=payment_plan_id
+    )
     headers = {
         "x-financial-id": "1",
         "x-customer-user-agent": "1",
         "Authorization": "1",
         "x-auth-date": "1",
         "x-jws-signature": "1",
-        "x-idempotency-key": "1",
+        "x-idempotency-key": f"{idempotency_key}",
         "x-customer-id": f"{x_customer_id}",
         "x-interactions-id": "1",
         "x-customer-ip-address": "1",
         "content-type": "application/json"
     }
 
-    response = requests.request("POST", url, json=payload, headers=headers)
+    return url, payload, headers
+
+def initiate_payment(payment_plan_id, blockId, ammount, x_customer_id, idempotency_key="1"):
+    url, payload, headers = _initiate_payment_request(payment_plan_id, blockId, ammount, x_customer_id, idempotency_key)
+    response = pis_upstream.request("POST", url, data=payload, headers=headers, idempotent=_retry_safe(idempotency_key))
     return response
 
+async def initiate_payment_async(payment_plan_id, blockId, ammount, x_customer_id, idempotency_key="1"):
+    url, payload, headers = _initiate_payment_request(payment_plan_id, blockId, ammount, x_customer_id, idempotency_key)
+    response = await pis_upstream.request_async("POST", url, content=payload, headers=headers, idempotent=_retry_safe(idempotency_key))
+    return response
+
+class PaymentStageError(Exception):
+    """A payment run that failed part-way, with the stage and timings so far"""
+
+    def __init__(self, stage, message, timings_ms, payment_plan_id=None):
+        super().__init__(message)
+        self.stage = stage
+        self.timings_ms = timings_ms
+        self.payment_plan_id = payment_plan_id
+
+
+def _response_body(response):
+    try:
+        return response.json()
+    except ValueError:
+        return response.text
+
+async def run_payment_async(ammount, x_customer_id, idempotency_key="1"):
+    """Plan, pick the first block and initiate in one call over the shared client"""
+    timings_ms = {}
+    payment_plan_id = None
+    stage = "plan"
+    started = time.perf_counter()
+    try:
+        stage_started = started
+        plan = await paymentplan_async(ammount, x_customer_id, _stage_key(idempotency_key, "plan"))
+        timings_ms["plan"] = (time.perf_counter() - stage_started) * 1000
+        payment_plan_id = plan.get("paymentPlanId") if isinstance(plan, dict) else None
+        if not payment_plan_id:
+            raise Exception(f"No paymentPlanId in payment plan response: {plan}")
+
+        stage = "blocks"
+        stage_started = time.perf_counter()
+        blocks = await get_payment_plan_blocks_async(payment_plan_id, x_customer_id)
+        timings_ms["blocks"] = (time.perf_counter() - stage_started) * 1000
+        if not blocks:
+            raise Exception(f"No blocks returned for payment plan {payment_plan_id}")
+        block_id = blocks[0]["blockId"]
+
+        stage = "initiate"
+        stage_started = time.perf_counter()
+        response = await initiate_payment_async(payment_plan_id, block_id, ammount, x_customer_id, _stage_key(idempotency_key, "initiate"))
+        timings_ms["initiate"] = (time.perf_counter() - stage_started) * 1000
+        if response.status_code >= 400:
+            raise Exception(f"Error initiating payment: {response.status_code} - {response.text}")
+    except Exception as e:
+        timings_ms["total"] = (time.perf_counter() - started) * 1000
+        raise PaymentStageError(stage, str(e), timings_ms, payment_plan_id) from e
+
+    timings_ms["total"] = (time.perf_counter() - started) * 1000
+    return {
+        "payment_plan_id": payment_plan_id,
+        "block_id": block_id,
+        "amount": ammount,
+        "x_customer_id": x_customer_id,
+        "initiation_status": response.status_code,
+        "initiation": _response_body(response),
+        "timings_ms": timings_ms
+    }
+
 #Test the functions
 if __name__ == "__main__":
     
@@ -0,0 +1,262 @@
+import asyncio
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+# Opt-in sampling profiler for single requests, output as collapsed stacks (flamegraph.pl, speedscope)
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_PATHS = tuple(p for p in os.getenv("PROFILE_PATHS", "/fetch-accounts,/payment-plan,/payments").split(",") if p)
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.002"))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+PROFILE_MAX_STORED = int(os.getenv("PROFILE_MAX_STORED", "50"))
+
+PROFILE_HEADER = b"x-profile"
+
+# Profile of the request being served; copied into tasks it creates
+_active_profile: ContextVar[Optional["RequestProfile"]] = ContextVar("active_profile", default=None)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def _fold(frame) -> List[str]:
+    """Frame chain as root-first labels"""
+    stack = []
+    while frame is not None:
+        stack.append(_frame_label(frame))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def _awaiting(coro) -> List[str]:
+    """Where a suspended coroutine is waiting, outermost first"""
+    stack = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        stack.append(_frame_label(frame))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return stack
+
+
+class RequestProfile:
+    """Samples the event loop thread while it runs one request's tasks"""
+
+    def __init__(self, method: str, path: str, reason: str, interval: float = PROFILE_INTERVAL):
+        self.id = uuid.uuid4().hex[:16]
+        self.method = method
+        self.path = path
+        self.reason = reason
+        self.interval = interval
+        self.started_at = time.time()
+        self.duration: Optional[float] = None
+        self.status: Optional[int] = None
+        self.stacks: Dict[str, int] = {}
+        self.running_samples = 0
+        self.waiting_samples = 0
+        self.other_samples = 0
+        self.tasks = weakref.WeakSet()
+        self._root: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread_id: Optional[int] = None
+        self._stop = threading.Event()
+        # Guards stacks and counters between the sampler thread and readers on the loop
+        self._lock = threading.Lock()
+        self._sampler: Optional[threading.Thread] = None
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._root = asyncio.current_task()
+        self._thread_id = threading.get_ident()
+        self.tasks.add(self._root)
+        self._sampler = threading.Thread(target=self._run, name=f"profile-{self.id}", daemon=True)
+        self._sampler.start()
+
+    def stop(self, status: Optional[int]):
+        # Not joined: this runs on the event loop, and the sampler drops anything taken after stop
+        self._stop.set()
+        self.status = status
+        self.duration = time.time() - self.started_at
+
+    def _sample(self):
+        try:
+            current = asyncio.current_task(self._loop)
+        except RuntimeError:
+            current = None
+        if current is not None and current in self.tasks:
+            frame = sys._current_frames().get(self._thread_id)
+            return ("running", _fold(frame)) if frame is not None else None
+        # Not on the CPU: record where the request is waiting (gateway, Supabase, another task)
+        root = self._root
+        if root is not None and not root.done():
+            try:
+                stack = _awaiting(root.get_coro())
+            except (AttributeError, ValueError):
+                stack = []
+            if stack:
+                return "waiting", ["[waiting]"] + stack
+        return "other", None
+
+    def _record(self, sample):
+        kind, stack = sample
+        with self._lock:
+            if self._stop.is_set():
+                return
+            if kind == "running":
+                self.running_samples += 1
+            elif kind == "waiting":
+                self.waiting_samples += 1
+            else:
+                self.other_samples += 1
+            if stack:
+                key = ";".join(stack)
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+
+    def _run(self):
+        deadline = time.monotonic() + PROFILE_MAX_SECONDS
+        while not self._stop.wait(self.interval):
+            if time.monotonic() > deadline:
+                break
+            sample = self._sample()
+            if sample is not None:
+                self._record(sample)
+
+    def collapsed(self) -> str:
+        """Brendan Gregg collapsed-stack text: `frame;frame;frame count` per line"""
+        with self._lock:
+            stacks = sorted(self.stacks.items())
+        return "".join(f"{stack} {count}\n" for stack, count in stacks)
+
+    def summary(self) -> Dict:
+        with self._lock:
+            return self._summary()
+
+    def _summary(self) -> Dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "reason": self.reason,
+            "status": self.status,
+            "started_at": self.started_at,
+            "duration_ms": None if self.duration is None else round(self.duration * 1000, 1),
+            "interval_ms": self.interval * 1000,
+            "samples_running": self.running_samples,
+            "samples_waiting": self.waiting_samples,
+            "samples_other_work": self.other_samples
+        }
+
+
+class ProfileStore:
+    """Most recent finished profiles, oldest evicted first"""
+
+    def __init__(self, max_entries: int = PROFILE_MAX_STORED):
+        self.max_entries = max_entries
+        self._profiles: "OrderedDict[str, RequestProfile]" = OrderedDict()
+
+    def add(self, profile: RequestProfile):
+        self._profiles[profile.id] = profile
+        while len(self._profiles) > self.max_entries:
+            self._profiles.popitem(last=False)
+
+    def get(self, profile_id: str) -> Optional[RequestProfile]:
+        return self._profiles.get(profile_id)
+
+    def list(self) -> List[Dict]:
+        return [profile.summary() for profile in reversed(self._profiles.values())]
+
+
+profile_store = ProfileStore()
+
+# Requests being profiled per loop; the task factory is only installed while there are any
+_profiling_loops: Dict[asyncio.AbstractEventLoop, list] = {}
+
+
+def _profiled_task_factory(previous):
+    def factory(loop, coro, **kwargs):
+        task = previous(loop, coro, **kwargs) if previous else asyncio.Task(coro, loop=loop, **kwargs)
+        profile = _active_profile.get()
+        if profile is not None:
+            profile.tasks.add(task)
+        return task
+    factory.previous = previous
+    return factory
+
+
+def _track_tasks(loop: asyncio.AbstractEventLoop):
+    if loop not in _profiling_loops:
+        _profiling_loops[loop] = [loop.get_task_factory()]
+        loop.set_task_factory(_profiled_task_factory(loop.get_task_factory()))
+    _profiling_loops[loop].append(None)
+
+
+def _untrack_tasks(loop: asyncio.AbstractEventLoop):
+    entry = _profiling_loops[loop]
+    entry.pop()
+    if len(entry) == 1:
+        loop.set_task_factory(entry[0])
+        del _profiling_loops[loop]
+
+
+def is_authorized(token: Optional[str]) -> bool:
+    """Whether a request may trigger or download profiles"""
+    return bool(PROFILE_TOKEN) and token == PROFILE_TOKEN
+
+
+class ProfilingMiddleware:
+    """ASGI middleware: profile requests carrying `X-Profile: <PROFILE_TOKEN>` or picked by PROFILE_SAMPLE_RATE"""
+
+    def __init__(self, app):
+        self.app = app
+
+    def _reason(self, scope) -> Optional[str]:
+        if not scope["path"].startswith(PROFILE_PATHS):
+            return None
+        if PROFILE_TOKEN:
+            for name, value in scope["headers"]:
+                if name == PROFILE_HEADER:
+                    return "header" if is_authorized(value.decode("latin-1")) else None
+        if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+            return "sampled"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        reason = self._reason(scope) if scope["type"] == "http" else None
+        if reason is None:
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(scope["method"], scope["path"], reason)
+        state = {"status": None}
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"x-profile-id", profile.id.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        loop = asyncio.get_running_loop()
+        token = _active_profile.set(profile)
+        _track_tasks(loop)
+        profile.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profile.stop(state["status"])
+            _untrack_tasks(loop)
+            _active_profile.reset(token)
+            profile_store.add(profile)
@@ -0,0 +1,364 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+import httpx
+import requests
+
+from http_client import get_session, get_async_client, HTTP_CONNECT_TIMEOUT
+from metrics import track_upstream, payload_size
+
+# Shared retry budget settings: retries may add at most this fraction of extra traffic
+RETRY_BUDGET_RATIO = float(os.getenv("RETRY_BUDGET_RATIO", "0.2"))
+RETRY_BUDGET_MIN_PER_SECOND = float(os.getenv("RETRY_BUDGET_MIN_PER_SECOND", "1"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+
+# Statuses worth another attempt; anything 5xx also counts against the circuit
+RETRYABLE_STATUS_CODES = frozenset({429, 502, 503, 504})
+
+
+def _setting(prefix: str, key: str, default, cast=float):
+    """Per-upstream setting, e.g. OFFERS_READ_TIMEOUT"""
+    value = os.getenv(f"{prefix}_{key}")
+    if value is None:
+        return default
+    if cast is bool:
+        return value.lower() in ("1", "true", "yes")
+    return cast(value)
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the upstream while its circuit is open"""
+
+    def __init__(self, upstream: str, retry_after: float):
+        super().__init__(f"{upstream} API is unavailable (circuit open, retry in {retry_after:.0f}s)")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures, then lets a single probe through after reset_timeout"""
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = max(failure_threshold, 1)
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.probe_started_at: Optional[float] = None
+        self.opens = 0
+        self._lock = threading.Lock()
+
+    def retry_after(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(self.opened_at + self.reset_timeout - time.monotonic(), 0.0)
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            now = time.monotonic()
+            if self.state == "open" and now - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                self.probe_started_at = None
+            if self.state == "half_open":
+                # One probe at a time; a probe that never reported back is replaced
+                if self.probe_started_at is None or now - self.probe_started_at >= self.reset_timeout:
+                    self.probe_started_at = now
+                    return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.consecutive_failures = 0
+            self.opened_at = None
+            self.probe_started_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.opens += 1
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self.probe_started_at = None
+
+
+class RetryBudget:
+    """Token bucket: each request earns `ratio` tokens, each retry or hedge spends one"""
+
+    def __init__(self, ratio: float = RETRY_BUDGET_RATIO, min_per_second: float = RETRY_BUDGET_MIN_PER_SECOND,
+                 max_tokens: float = 100.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens * 0.1
+        self._refilled_at = time.monotonic()
+        self.exhausted = 0
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.tokens + self.ratio, self.max_tokens)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            # Floor so a quiet upstream can still retry occasionally
+            self.tokens = min(self.tokens + (now - self._refilled_at) * self.min_per_second, self.max_tokens)
+            self._refilled_at = now
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return True
+            self.exhausted += 1
+            return False
+
+
+class RateLimiter:
+    """Async token bucket: at most `rate` acquisitions per second, bursts up to `burst`"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = max(burst if burst is not None else rate, 1.0)
+        self.tokens = self.burst
+        self._refilled_at = time.monotonic()
+        self.waits = 0
+        self.waited_seconds = 0.0
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        waited = False
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.tokens + (now - self._refilled_at) * self.rate, self.burst)
+            self._refilled_at = now
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return
+            if not waited:
+                self.waits += 1
+                waited = True
+            delay = (1.0 - self.tokens) / self.rate
+            self.waited_seconds += delay
+            await asyncio.sleep(delay)
+
+
+# Rate limit applied to async upstream calls made from the current context (e.g. background sync)
+_rate_limit: ContextVar[Optional[RateLimiter]] = ContextVar("upstream_rate_limit", default=None)
+
+
+def limit_upstream_calls(limiter: Optional[RateLimiter]):
+    """Throttle async upstream calls made from this context and the tasks it starts"""
+    return _rate_limit.set(limiter)
+
+
+class LatencyTracker:
+    """Recent successful latencies, used to pick the hedging delay"""
+
+    def __init__(self, window: int = 200):
+        self.samples = deque(maxlen=window)
+        self._p95: Optional[float] = None
+        self._since_sort = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self.samples.append(seconds)
+            self._since_sort += 1
+
+    def p95(self) -> Optional[float]:
+        with self._lock:
+            if len(self.samples) < HEDGE_MIN_SAMPLES:
+                return None
+            # Re-sorting every request would cost more than it saves
+            if self._p95 is None or self._since_sort >= 20:
+                ordered = sorted(self.samples)
+                self._p95 = ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)]
+                self._since_sort = 0
+            return self._p95
+
+
+class Upstream:
+    """Timeouts, budgeted jittered retries, circuit breaking and optional hedging for one upstream API"""
+
+    def __init__(self, name: str, prefix: str, read_timeout: float, hedge: bool):
+        self.name = name
+        self.connect_timeout = _setting(prefix, "CONNECT_TIMEOUT", HTTP_CONNECT_TIMEOUT)
+        self.read_timeout = _setting(prefix, "READ_TIMEOUT", read_timeout)
+        self.retries = _setting(prefix, "RETRIES", 2, int)
+        self.retry_backoff = _setting(prefix, "RETRY_BACKOFF", 0.1)
+        self.hedge = _setting(prefix, "HEDGE", hedge, bool)
+        self.hedge_min_delay = _setting(prefix, "HEDGE_MIN_DELAY", 0.05)
+        self.breaker = CircuitBreaker(
+            _setting(prefix, "BREAKER_FAILURES", 5, int),
+            _setting(prefix, "BREAKER_RESET", 30.0)
+        )
+        self.budget = RetryBudget()
+        self.latency = LatencyTracker()
+        self.requests = 0
+        self.failures = 0
+        self.retried = 0
+        self.short_circuited = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    @property
+    def sync_timeout(self):
+        return (self.connect_timeout, self.read_timeout)
+
+    @property
+    def async_timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(self.read_timeout, connect=self.connect_timeout)
+
+    def _admit(self):
+        if not self.breaker.allow():
+            self.short_circuited += 1
+            raise CircuitOpenError(self.name, self.breaker.retry_after())
+        self.requests += 1
+        self.budget.deposit()
+
+    def _record(self, status_code: Optional[int]):
+        if status_code is None or status_code >= 500:
+            self.failures += 1
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    def _may_retry(self, idempotent: bool, attempt: int) -> bool:
+        return idempotent and attempt < self.retries and self.breaker.allow() and self.budget.withdraw()
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter so retries from many workers don't line up
+        return random.uniform(0, self.retry_backoff * (2 ** attempt))
+
+    def request(self, method: str, url: str, idempotent: Optional[bool] = None, **kwargs) -> requests.Response:
+        """Blocking request through the pooled session"""
+        if idempotent is None:
+            idempotent = method.upper() in ("GET", "HEAD")
+        kwargs.setdefault("timeout", self.sync_timeout)
+        self._admit()
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                with track_upstream(self.name, method, payload_size(kwargs.get("data"))) as call:
+                    response = get_session(url).request(method, url, **kwargs)
+                    call.done(response.status_code, len(response.content))
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                self._record(None)
+                if not self._may_retry(idempotent, attempt):
+                    raise
+            else:
+                self._record(response.status_code)
+                if response.status_code < 500:
+                    self.latency.observe(time.perf_counter() - started)
+                if response.status_code not in RETRYABLE_STATUS_CODES or not self._may_retry(idempotent, attempt):
+                    return response
+            attempt += 1
+            self.retried += 1
+            time.sleep(self._backoff(attempt))
+
+    async def _call_async(self, method: str, url: str, kwargs: Dict[str, Any]) -> httpx.Response:
+        with track_upstream(self.name, method, payload_size(kwargs.get("content"))) as call:
+            response = await get_async_client().request(method, url, **kwargs)
+            call.done(response.status_code, len(response.content))
+        return response
+
+    async def _send_async(self, method: str, url: str, hedge: bool, kwargs: Dict[str, Any]) -> httpx.Response:
+        """One attempt, with a second copy raced against it once the p95 delay has passed"""
+        started = time.perf_counter()
+        delay = self.latency.p95() if hedge else None
+        if delay is None:
+            response = await self._call_async(method, url, kwargs)
+            if response.status_code < 500:
+                self.latency.observe(time.perf_counter() - started)
+            return response
+
+        first = asyncio.ensure_future(self._call_async(method, url, kwargs))
+        tasks = [first]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=max(delay, self.hedge_min_delay))
+            if not done and self.budget.withdraw():
+                self.hedged += 1
+                tasks.append(asyncio.ensure_future(self._call_async(method, url, kwargs)))
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and (task.result().status_code < 500 or not pending):
+                        if task is not first:
+                            self.hedge_wins += 1
+                        if task.result().status_code < 500:
+                            self.latency.observe(time.perf_counter() - started)
+                        return task.result()
+            # Every copy failed: surface the original request's outcome
+            return first.result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def request_async(self, method: str, url: str, idempotent: Optional[bool] = None,
+                            hedge: Optional[bool] = None, **kwargs) -> httpx.Response:
+        """Non-blocking request through the shared async client; only idempotent requests are retried or hedged"""
+        if idempotent is None:
+            idempotent = method.upper() in ("GET", "HEAD")
+        hedge = idempotent and (self.hedge if hedge is None else hedge)
+        kwargs.setdefault("timeout", self.async_timeout)
+        self._admit()
+        attempt = 0
+        limiter = _rate_limit.get()
+        while True:
+            if limiter is not None:
+                await limiter.acquire()
+            try:
+                response = await self._send_async(method, url, hedge, kwargs)
+            except httpx.TransportError:
+                self._record(None)
+                if not self._may_retry(idempotent, attempt):
+                    raise
+            else:
+                self._record(response.status_code)
+                if response.status_code not in RETRYABLE_STATUS_CODES or not self._may_retry(idempotent, attempt):
+                    return response
+            attempt += 1
+            self.retried += 1
+            await asyncio.sleep(self._backoff(attempt))
+
+    def stats(self) -> Dict[str, Any]:
+        """Breaker state and retry/hedge counters"""
+        return {
+            "circuit": self.breaker.state,
+            "consecutive_failures": self.breaker.consecutive_failures,
+            "circuit_opens": self.breaker.opens,
+            "retry_after_seconds": self.breaker.retry_after() if self.breaker.state != "closed" else None,
+            "connect_timeout_seconds": self.connect_timeout,
+            "read_timeout_seconds": self.read_timeout,
+            "requests": self.requests,
+            "failures": self.failures,
+            "retries": self.retried,
+            "retry_budget_tokens": round(self.budget.tokens, 2),
+            "retry_budget_exhausted": self.budget.exhausted,
+            "short_circuited": self.short_circuited,
+            "hedge_enabled": self.hedge,
+            "hedge_delay_seconds": self.latency.p95(),
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins
+        }
+
+
+# One policy per gateway API so an unhealthy API doesn't take the others down with it
+accounts_upstream = Upstream("accounts", "ACCOUNTS", read_timeout=10.0, hedge=True)
+offers_upstream = Upstream("offers", "OFFERS", read_timeout=10.0, hedge=True)
+pis_upstream = Upstream("pis", "PIS", read_timeout=30.0, hedge=False)
+
+upstreams = {u.name: u for u in (accounts_upstream, offers_upstream, pis_upstream)}
@@ -0,0 +1,239 @@
+import gzip
+import hashlib
+import json
+import os
+import zlib
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Hashable, Optional, Tuple
+
+from fastapi import Request, Response
+from fastapi.responses import StreamingResponse
+
+try:
+    import brotli
+except ImportError:  # optional; gzip is used when it isn't installed
+    brotli = None
+
+# Conditional GET and compression settings (overridable through the environment)
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000"))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+SUPPORTED_ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+# Strong validators must differ per content coding, so compressed variants get a suffixed ETag
+_ETAG_SUFFIXES = {"gzip": "-gz", "br": "-br"}
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Best supported content coding from an Accept-Encoding header (br preferred on ties)"""
+    if not accept_encoding:
+        return None
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[coding.strip().lower()] = q
+    best, best_q = None, 0.0
+    for coding in SUPPORTED_ENCODINGS:
+        q = weights.get(coding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def variant_etag(etag: str, encoding: Optional[str]) -> str:
+    """ETag of a representation sent with the given content coding"""
+    if encoding is None:
+        return etag
+    return etag[:-1] + _ETAG_SUFFIXES[encoding] + '"'
+
+
+def _base_etag(etag: str) -> str:
+    for suffix in _ETAG_SUFFIXES.values():
+        if etag.endswith(suffix + '"'):
+            return etag[:-len(suffix) - 1] + '"'
+    return etag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison, as If-None-Match requires; any coding of the same content matches"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or _base_etag(candidate.removeprefix("W/")) == etag:
+            return True
+    return False
+
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+class Representation:
+    """Serialised body, strong ETag and compressed variants of one response"""
+    __slots__ = ("source", "body", "etag", "variants")
+
+    def __init__(self, source: Any, body: bytes, etag: str):
+        self.source = source
+        self.body = body
+        self.etag = etag
+        self.variants: Dict[str, bytes] = {}
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(len(v) for v in self.variants.values())
+
+
+class ResponseCache:
+    """LRU of encoded responses so cached snapshots are not re-serialised or recompressed on every hit"""
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES, max_bytes: int = RESPONSE_CACHE_MAX_BYTES):
+        self.max_entries = max(max_entries, 1)
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, Representation]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.uncached = 0
+        self.not_modified = 0
+        self.compressions = 0
+        self.compressed_hits = 0
+        self.bytes_uncompressed = 0
+        self.bytes_sent = 0
+        self.evictions = 0
+
+    def _store(self, key: Hashable, representation: Representation):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old.size
+        self._entries[key] = representation
+        self._bytes += representation.size
+        self._evict()
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+            self.evictions += 1
+
+    def _representation(self, content: Any, key: Optional[Hashable], source: Any) -> Tuple[Representation, Hashable]:
+        if key is not None and source is not None:
+            cached = self._entries.get(key)
+            # Same snapshot object as last time: the body and variants are still valid
+            if cached is not None and cached.source is source:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return cached, key
+        # Same spacing as FastAPI's JSONResponse
+        body = json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+        etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        representation = Representation(source, body, etag)
+        if key is None:
+            # Only bodies the caller names are kept; others get ETag/304 handling but no space in the LRU
+            self.uncached += 1
+            return representation, None
+        self.misses += 1
+        self._store(key, representation)
+        return representation, key
+
+    def json_response(self, request: Request, content: Any, key: Optional[Hashable] = None,
+                      source: Any = None) -> Response:
+        """JSON response with a strong ETag, 304 on If-None-Match and negotiated compression
+
+        Bodies are kept only when `key` is given. `source` is the cached object `content` was built
+        from; while the same object is passed for `key`, the encoded body is reused without
+        serialising again.
+        """
+        representation, key = self._representation(content, key, source)
+        body = representation.body
+        encoding = None
+        if len(body) >= COMPRESSION_MIN_BYTES:
+            encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+        headers = {
+            "ETag": variant_etag(representation.etag, encoding),
+            "Vary": "Accept-Encoding",
+            "Cache-Control": "private, no-cache"
+        }
+        if etag_matches(request.headers.get("if-none-match"), representation.etag):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+
+        if encoding is not None:
+            compressed = representation.variants.get(encoding)
+            if compressed is None:
+                compressed = _compress(body, encoding)
+                representation.variants[encoding] = compressed
+                self.compressions += 1
+                if self._entries.get(key) is representation:
+                    self._bytes += len(compressed)
+                    self._evict()
+            else:
+                self.compressed_hits += 1
+            body = compressed
+            headers["Content-Encoding"] = encoding
+        self.bytes_uncompressed += len(representation.body)
+        self.bytes_sent += len(body)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    def streaming_response(self, request: Request, chunks: AsyncIterator[str], media_type: str) -> StreamingResponse:
+        """Stream text chunks, compressed on the fly when the client accepts it"""
+        encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+        if encoding is None:
+            return StreamingResponse(chunks, media_type=media_type, headers={"Vary": "Accept-Encoding"})
+
+        async def compressed():
+            if encoding == "br":
+                compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+                process, flush, finish = compressor.process, compressor.flush, compressor.finish
+            else:
+                compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+                process, flush, finish = compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+            async for chunk in chunks:
+                raw = chunk.encode("utf-8")
+                self.bytes_uncompressed += len(raw)
+                # Flush per page so clients can parse rows as they arrive
+                data = process(raw) + flush()
+                if data:
+                    self.bytes_sent += len(data)
+                    yield data
+            tail = finish()
+            self.bytes_sent += len(tail)
+            yield tail
+
+        return StreamingResponse(
+            compressed(), media_type=media_type,
+            headers={"Content-Encoding": encoding, "Vary": "Accept-Encoding"}
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit, 304 and compression counters"""
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "encodings": list(SUPPORTED_ENCODINGS),
+            "min_compress_bytes": COMPRESSION_MIN_BYTES,
+            "hits": self.hits,
+            "misses": self.misses,
+            "uncached": self.uncached,
+            "not_modified": self.not_modified,
+            "compressions": self.compressions,
+            "compressed_hits": self.compressed_hits,
+            "bytes_uncompressed": self.bytes_uncompressed,
+            "bytes_sent": self.bytes_sent,
+            "evictions": self.evictions
+        }
+
+
+# Global response representation cache
+response_cache = ResponseCache()
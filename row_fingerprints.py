@@ -0,0 +1,151 @@
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+# Change detection for Accounts upserts (overridable through the environment)
+ROW_FINGERPRINTS_ENABLED = os.getenv("ROW_FINGERPRINTS_ENABLED", "true").lower() in ("1", "true", "yes")
+ROW_FINGERPRINTS_MAX_ENTRIES = int(os.getenv("ROW_FINGERPRINTS_MAX_ENTRIES", "500000"))
+# How long a customer's fingerprints are trusted before they are re-read from Supabase
+ROW_FINGERPRINTS_TTL = float(os.getenv("ROW_FINGERPRINTS_TTL", "3600"))
+ROW_FINGERPRINTS_LOAD_BATCH = int(os.getenv("ROW_FINGERPRINTS_LOAD_BATCH", "100"))
+ROW_FINGERPRINTS_PAGE_SIZE = int(os.getenv("ROW_FINGERPRINTS_PAGE_SIZE", "1000"))
+
+
+def _canonical(value: Any) -> Any:
+    # PostgREST returns numeric columns as 1000 or 1000.0 depending on the value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return value
+
+
+class RowFingerprintCache:
+    """Content hash of the last-written version of each row, so unchanged rows are not sent again"""
+
+    def __init__(self, key_columns: Tuple[str, ...] = ("account_id", "customer_id"),
+                 scope_column: str = "customer_id",
+                 max_entries: int = ROW_FINGERPRINTS_MAX_ENTRIES,
+                 ttl: float = ROW_FINGERPRINTS_TTL,
+                 enabled: bool = ROW_FINGERPRINTS_ENABLED):
+        self.key_columns = key_columns
+        self.scope_column = scope_column
+        self.max_entries = max(max_entries, 1)
+        self.ttl = ttl
+        self.enabled = enabled
+        self._fingerprints: "OrderedDict[Hashable, bytes]" = OrderedDict()
+        # When each scope (customer) was last read back from storage
+        self._loaded: "OrderedDict[Any, float]" = OrderedDict()
+        self.rows_checked = 0
+        self.rows_changed = 0
+        self.rows_skipped = 0
+        self.loads = 0
+        self.rows_loaded = 0
+        self.load_failures = 0
+        self.evictions = 0
+        self.last_error: Optional[str] = None
+
+    def _key(self, row: Dict) -> Hashable:
+        return tuple(row.get(column) for column in self.key_columns)
+
+    @staticmethod
+    def fingerprint(row: Dict, columns: Iterable[str]) -> bytes:
+        """Hash of the given columns of a row, insensitive to int/float spelling"""
+        canonical = {column: _canonical(row.get(column)) for column in columns}
+        encoded = json.dumps(canonical, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")
+        return hashlib.blake2b(encoded, digest_size=16).digest()
+
+    def _unloaded_scopes(self, rows: List[Dict]) -> List[Any]:
+        now = time.monotonic()
+        scopes = []
+        for scope in dict.fromkeys(row.get(self.scope_column) for row in rows):
+            loaded_at = self._loaded.get(scope)
+            if loaded_at is None or now - loaded_at > self.ttl:
+                scopes.append(scope)
+        return scopes
+
+    def _set(self, key: Hashable, fingerprint: bytes):
+        self._fingerprints[key] = fingerprint
+        self._fingerprints.move_to_end(key)
+        while len(self._fingerprints) > self.max_entries:
+            self._fingerprints.popitem(last=False)
+            self.evictions += 1
+
+    def _absorb(self, scopes: List[Any], stored_rows: List[Dict], columns: List[str], rows: List[Dict]):
+        """Take stored rows as the last-written versions of their scopes"""
+        now = time.monotonic()
+        for scope in scopes:
+            self._loaded[scope] = now
+            self._loaded.move_to_end(scope)
+        stored_keys = set()
+        for row in stored_rows:
+            key = self._key(row)
+            stored_keys.add(key)
+            self._set(key, self.fingerprint(row, columns))
+        # Rows missing from storage (e.g. deleted) must not match an old fingerprint
+        loaded = set(scopes)
+        for row in rows:
+            key = self._key(row)
+            if row.get(self.scope_column) in loaded and key not in stored_keys:
+                self._fingerprints.pop(key, None)
+        while len(self._loaded) > self.max_entries:
+            self._loaded.popitem(last=False)
+        self.loads += 1
+        self.rows_loaded += len(stored_rows)
+
+    def _changed(self, rows: List[Dict], columns: List[str]) -> List[Dict]:
+        changed = [row for row in rows if self._fingerprints.get(self._key(row)) != self.fingerprint(row, columns)]
+        self.rows_checked += len(rows)
+        self.rows_changed += len(changed)
+        self.rows_skipped += len(rows) - len(changed)
+        return changed
+
+    def _batches(self, scopes: List[Any]) -> List[List[Any]]:
+        size = max(ROW_FINGERPRINTS_LOAD_BATCH, 1)
+        return [scopes[i:i + size] for i in range(0, len(scopes), size)]
+
+    async def changed_async(self, rows: List[Dict],
+                            load: Callable[[List[Any], List[str]], Awaitable[List[Dict]]]) -> List[Dict]:
+        """Rows whose content differs from the last-written version; `load(scopes, columns)` reads stored rows"""
+        if not self.enabled or not rows:
+            return rows
+        columns = list(rows[0].keys())
+        try:
+            for scopes in self._batches(self._unloaded_scopes(rows)):
+                self._absorb(scopes, await load(scopes, columns), columns, rows)
+        except Exception as e:
+            # Without the stored versions, write everything
+            self.load_failures += 1
+            self.last_error = str(e)
+            return rows
+        return self._changed(rows, columns)
+
+    def remember(self, rows: Iterable[Dict]):
+        """Record rows as written"""
+        if not self.enabled:
+            return
+        for row in rows:
+            self._set(self._key(row), self.fingerprint(row, row.keys()))
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache size and written/skipped counters"""
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._fingerprints),
+            "customers_loaded": len(self._loaded),
+            "ttl_seconds": self.ttl,
+            "rows_checked": self.rows_checked,
+            "rows_changed": self.rows_changed,
+            "rows_skipped": self.rows_skipped,
+            "skip_ratio": self.rows_skipped / self.rows_checked if self.rows_checked else 0.0,
+            "loads": self.loads,
+            "rows_loaded": self.rows_loaded,
+            "load_failures": self.load_failures,
+            "evictions": self.evictions,
+            "last_error": self.last_error
+        }
+
+
+# Fingerprints of stored Accounts rows
+account_fingerprints = RowFingerprintCache()
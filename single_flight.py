@@ -0,0 +1,62 @@
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+# Set to false to give every request its own upstream call
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() in ("1", "true", "yes")
+
+
+def flight_key(endpoint: str, customer_id: Any, **params) -> Tuple:
+    """Key identifying identical upstream calls: (endpoint, customer, params)"""
+    return (endpoint, customer_id, tuple(sorted(params.items())))
+
+
+class SingleFlight:
+    """Collapses concurrent identical upstream calls onto one in-flight task"""
+
+    def __init__(self, enabled: bool = SINGLE_FLIGHT_ENABLED):
+        self.enabled = enabled
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+        self._counters: Dict[str, Dict[str, int]] = {}
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+
+    async def do(self, key: Tuple, call: Callable[[], Awaitable[Any]]) -> Any:
+        """Run call() unless an identical call is already running; every caller gets the same result"""
+        if not self.enabled:
+            return await call()
+        counters = self._counters.get(key[0])
+        if counters is None:
+            counters = self._counters[key[0]] = {"calls": 0, "upstream_calls": 0, "collapsed": 0}
+        counters["calls"] += 1
+
+        task = self._in_flight.get(key)
+        if task is None:
+            counters["upstream_calls"] += 1
+            task = asyncio.ensure_future(call())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            counters["collapsed"] += 1
+        # Shielded so one caller disconnecting doesn't cancel the call for the others
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-endpoint call and collapse counters"""
+        endpoints = {}
+        for endpoint, counters in self._counters.items():
+            endpoints[endpoint] = {
+                **counters,
+                "collapse_ratio": counters["collapsed"] / counters["calls"] if counters["calls"] else 0.0
+            }
+        return {
+            "enabled": self.enabled,
+            "in_flight": len(self._in_flight),
+            "endpoints": endpoints
+        }
+
+
+# Global single-flight group shared by the gateway callers
+single_flight = SingleFlight()
@@ -0,0 +1,26 @@
+import pytest
+
+from balance_history import parse_timestamp
+
+EPOCH_2024 = 1704067200.0  # 2024-01-01T00:00:00Z
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("2024-01-01", EPOCH_2024),
+    ("2024-01-01T00:00:00", EPOCH_2024),
+    ("2024-01-01T00:00:00Z", EPOCH_2024),
+    ("2024-01-01T00:00:00+00:00", EPOCH_2024),
+    # PostgREST trims trailing zeros from the fraction and may send a bare-hour offset
+    ("2024-01-01T00:00:00.5+00", EPOCH_2024 + 0.5),
+    ("2024-01-01T00:00:00.12345+00:00", EPOCH_2024 + 0.12345),
+    ("2024-01-01 00:00:00.1234567+00", EPOCH_2024 + 0.123456),
+    ("2024-01-01T02:00:00.25+02", EPOCH_2024 + 0.25),
+    ("2024-01-01T05:30:00+0530", EPOCH_2024),
+])
+def test_parse_timestamp(value, expected):
+    assert parse_timestamp(value) == pytest.approx(expected)
+
+
+def test_parse_timestamp_rejects_garbage():
+    with pytest.raises(ValueError):
+        parse_timestamp("not a timestamp")
@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from idempotency import IdempotencyKeyConflict, IdempotencyStore
+
+
+def _counting_call(result):
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return result
+
+    return call, calls
+
+
+def test_repeated_key_replays_the_stored_result():
+    store = IdempotencyStore()
+    call, calls = _counting_call({"status": "ok"})
+
+    async def scenario():
+        first = await store.run("payment", "k1", {"amount": 10}, call)
+        second = await store.run("payment", "k1", {"amount": 10}, call)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first == ({"status": "ok"}, False)
+    assert second == ({"status": "ok"}, True)
+    assert len(calls) == 1
+
+
+def test_concurrent_duplicates_join_the_call_in_flight():
+    store = IdempotencyStore()
+    call, calls = _counting_call({"status": "ok"})
+
+    async def scenario():
+        return await asyncio.gather(*(store.run("payment", "k1", {"amount": 10}, call) for _ in range(3)))
+
+    results = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert sorted(replayed for _, replayed in results) == [False, True, True]
+    assert store.joined == 2
+
+
+def test_key_reused_with_different_parameters_conflicts():
+    store = IdempotencyStore()
+    call, calls = _counting_call({"status": "ok"})
+
+    async def scenario():
+        await store.run("payment", "k1", {"amount": 10}, call)
+        await store.run("payment", "k1", {"amount": 20}, call)
+
+    with pytest.raises(IdempotencyKeyConflict):
+        asyncio.run(scenario())
+    assert len(calls) == 1
+    assert store.conflicts == 1
+
+
+def test_failures_are_not_stored():
+    store = IdempotencyStore()
+    attempts = []
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("gateway timeout")
+        return {"status": "ok"}
+
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            await store.run("payment", "k1", {"amount": 10}, flaky)
+        return await store.run("payment", "k1", {"amount": 10}, flaky)
+
+    assert asyncio.run(scenario()) == ({"status": "ok"}, False)
+
+
+def test_sqlite_backend_replays_after_restart(tmp_path):
+    path = str(tmp_path / "idempotency.db")
+    call, calls = _counting_call({"status": "ok"})
+
+    asyncio.run(IdempotencyStore(sqlite_path=path).run("payment", "k1", {"amount": 10}, call))
+    restarted = IdempotencyStore(sqlite_path=path)
+    result = asyncio.run(restarted.run("payment", "k1", {"amount": 10}, call))
+    restarted.close()
+
+    assert result == ({"status": "ok"}, True)
+    assert len(calls) == 1
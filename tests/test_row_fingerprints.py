@@ -0,0 +1,59 @@
+import asyncio
+
+from row_fingerprints import RowFingerprintCache
+
+
+def _row(account_id, balance, customer_id="C1"):
+    return {"account_id": account_id, "customer_id": customer_id, "balance_amount": balance}
+
+
+def _changed(cache, rows, stored):
+    loads = []
+
+    async def load(scopes, columns):
+        loads.append(list(scopes))
+        return [{column: row.get(column) for column in columns} for row in stored if row["customer_id"] in scopes]
+
+    return asyncio.run(cache.changed_async(rows, load)), loads
+
+
+def test_rows_matching_storage_are_skipped():
+    cache = RowFingerprintCache(enabled=True)
+    # Stored numerics come back as floats; 100 and 100.0 are the same value
+    changed, loads = _changed(cache, [_row("A1", 100), _row("A2", 50)], [_row("A1", 100.0), _row("A2", 40)])
+    assert changed == [_row("A2", 50)]
+    assert loads == [["C1"]]
+    assert cache.rows_skipped == 1
+
+
+def test_remembered_rows_are_skipped_without_reloading():
+    cache = RowFingerprintCache(enabled=True)
+    rows = [_row("A1", 100)]
+    changed, _ = _changed(cache, rows, [])
+    assert changed == rows
+    cache.remember(changed)
+
+    changed, loads = _changed(cache, rows, [])
+    assert changed == []
+    assert loads == []
+
+
+def test_rows_deleted_from_storage_are_written_again():
+    cache = RowFingerprintCache(enabled=True, ttl=0)
+    rows = [_row("A1", 100)]
+    cache.remember(rows)
+    # The scope is reloaded (ttl=0) and the row is gone from storage
+    changed, _ = _changed(cache, rows, [])
+    assert changed == rows
+
+
+def test_load_failure_writes_everything():
+    cache = RowFingerprintCache(enabled=True)
+    cache.remember([_row("A1", 100)])
+
+    async def load(scopes, columns):
+        raise RuntimeError("Supabase down")
+
+    rows = [_row("A1", 100)]
+    assert asyncio.run(cache.changed_async(rows, load)) == rows
+    assert cache.load_failures == 1
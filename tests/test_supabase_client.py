@@ -0,0 +1,20 @@
+import pytest
+
+from customer_index import customers_after
+from supabase_client import postgrest_quote
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("C1", '"C1"'),
+    ("a,b", '"a,b"'),
+    ("a)b", '"a)b"'),
+    ('say "hi"', '"say \\"hi\\""'),
+    ("back\\slash", '"back\\\\slash"'),
+    (42, '"42"'),
+])
+def test_postgrest_quote(value, expected):
+    assert postgrest_quote(value) == expected
+
+
+def test_customers_after_is_sent_as_a_logic_tree():
+    assert customers_after('x,"y"') == {"or": '(customer_id.gt."x,\\"y\\"")'}
@@ -0,0 +1,110 @@
+import asyncio
+
+from write_behind import WriteBehindQueue
+
+
+class StoreError(Exception):
+    def __init__(self, message, failed_rows=None):
+        super().__init__(message)
+        self.failed_rows = failed_rows
+
+
+def _queue(writer, **kwargs):
+    kwargs.setdefault("flush_interval", 0.01)
+    return WriteBehindQueue(writer, key=lambda row: row["id"], **kwargs)
+
+
+def test_stop_waits_for_the_running_write_and_drains_the_rest():
+    written = []
+
+    async def writer(batch):
+        await asyncio.sleep(0.05)
+        written.extend(row["id"] for row in batch)
+
+    async def scenario():
+        queue = _queue(writer)
+        queue.start()
+        await queue.enqueue([{"id": 1}])
+        await asyncio.sleep(0.02)  # the flusher is now inside the slow write
+        await queue.enqueue([{"id": 2}])
+        return await queue.stop()
+
+    assert asyncio.run(scenario()) == 0
+    assert sorted(written) == [1, 2]
+
+
+def test_cancelled_flush_requeues_its_batch():
+    async def scenario():
+        entered = asyncio.Event()
+
+        async def writer(batch):
+            entered.set()
+            await asyncio.sleep(10)
+
+        queue = _queue(writer)
+        await queue.enqueue([{"id": 1}, {"id": 2}])
+        flush = asyncio.ensure_future(queue.flush())
+        await entered.wait()
+        flush.cancel()
+        try:
+            await flush
+        except asyncio.CancelledError:
+            pass
+        return queue
+
+    queue = asyncio.run(scenario())
+    assert queue.depth == 2
+    assert queue.flushed_rows == 0
+
+
+def test_newer_write_wins_over_requeued_row():
+    async def scenario():
+        queue = None
+
+        async def writer(batch):
+            # A newer version of row 1 arrives while the failing write is in flight
+            await queue.enqueue([{"id": 1, "v": 2}])
+            raise StoreError("down")
+
+        queue = _queue(writer)
+        await queue.enqueue([{"id": 1, "v": 1}])
+        await queue.flush()
+        return queue
+
+    queue = asyncio.run(scenario())
+    assert list(queue._pending.values()) == [{"id": 1, "v": 2}]
+
+
+def test_permanently_rejected_rows_are_dead_lettered():
+    written = []
+
+    async def writer(batch):
+        bad = [row for row in batch if row["id"] == "bad"]
+        written.extend(row["id"] for row in batch if row["id"] != "bad")
+        if bad:
+            raise StoreError("rejected", failed_rows=bad)
+
+    async def scenario():
+        queue = _queue(writer, max_attempts=3)
+        await queue.enqueue([{"id": "bad"}, {"id": "good"}])
+        for _ in range(5):
+            await queue.flush()
+        return queue
+
+    queue = asyncio.run(scenario())
+    assert written == ["good"]
+    assert queue.dead_letter_rows == 1
+    assert queue.depth == 0
+
+
+def test_stop_reports_rows_it_could_not_write():
+    async def writer(batch):
+        raise StoreError("down")
+
+    async def scenario():
+        queue = _queue(writer)
+        queue.start()
+        await queue.enqueue([{"id": 1}, {"id": 2}])
+        return await queue.stop(drain_attempts=1)
+
+    assert asyncio.run(scenario()) == 2
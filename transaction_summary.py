@@ -0,0 +1,223 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from single_flight import single_flight, flight_key
+
+# Transaction columns read by the summary (overridable through the environment)
+TRANSACTIONS_AMOUNT_COLUMN = os.getenv("TRANSACTIONS_AMOUNT_COLUMN", "amount")
+TRANSACTIONS_DIRECTION_COLUMN = os.getenv("TRANSACTIONS_DIRECTION_COLUMN", "direction")
+TRANSACTIONS_CATEGORY_COLUMN = os.getenv("TRANSACTIONS_CATEGORY_COLUMN", "category")
+TRANSACTION_SUMMARY_MAX_ENTRIES = int(os.getenv("TRANSACTION_SUMMARY_MAX_ENTRIES", "10000"))
+# How long a summary is served without asking Supabase for newer transactions
+TRANSACTION_SUMMARY_CHECK_INTERVAL = float(os.getenv("TRANSACTION_SUMMARY_CHECK_INTERVAL", "5"))
+# Catch-ups only see appended rows; rebuild from scratch this often to pick up edits and deletes
+TRANSACTION_SUMMARY_MAX_AGE = float(os.getenv("TRANSACTION_SUMMARY_MAX_AGE", "900"))
+
+PERIODS = ("day", "week", "month", "year")
+_PERIOD_LENGTHS = {"day": 10, "month": 7, "year": 4}
+
+
+def _period_keys(np, dates, period: str):
+    """Bucket label per row from ISO date strings ('' when the date is missing)"""
+    if period == "week":
+        # Monday of the ISO week; 1970-01-01 was a Thursday
+        valid = np.char.str_len(dates) >= 10
+        days = np.zeros(len(dates), dtype="datetime64[D]")
+        days[valid] = dates[valid].astype("U10").astype("datetime64[D]")
+        offsets = (days.astype(np.int64) + 3) % 7
+        mondays = (days - offsets.astype("timedelta64[D]")).astype("U10")
+        return np.where(valid, mondays, "")
+    return dates.astype(f"U{_PERIOD_LENGTHS[period]}")
+
+
+def _new_bucket() -> Dict[str, Any]:
+    return {"count": 0, "credit_count": 0, "debit_count": 0, "total_credit": 0.0, "total_debit": 0.0}
+
+
+class _Accumulator:
+    """Running totals for one account, extended page by page"""
+
+    def __init__(self, period: str):
+        self.period = period
+        self.totals = _new_bucket()
+        self.periods: Dict[str, Dict[str, Any]] = {}
+        self.categories: Dict[str, Dict[str, Any]] = {}
+        self.first_at: Optional[str] = None
+        self.last_at: Optional[str] = None
+        self.cursor: Optional[Any] = None
+
+    @staticmethod
+    def _merge(target: Dict[str, Dict[str, Any]], np, labels, is_debit, amounts):
+        keys, inverse = np.unique(labels, return_inverse=True)
+        counts = np.bincount(inverse)
+        debit_counts = np.bincount(inverse, weights=is_debit)
+        credit_sums = np.bincount(inverse, weights=np.where(is_debit, 0.0, amounts))
+        debit_sums = np.bincount(inverse, weights=np.where(is_debit, amounts, 0.0))
+        for i, key in enumerate(keys.tolist()):
+            bucket = target.get(key or "unknown")
+            if bucket is None:
+                bucket = target[key or "unknown"] = _new_bucket()
+            bucket["count"] += int(counts[i])
+            bucket["debit_count"] += int(debit_counts[i])
+            bucket["credit_count"] += int(counts[i] - debit_counts[i])
+            bucket["total_credit"] += float(credit_sums[i])
+            bucket["total_debit"] += float(debit_sums[i])
+
+    def add_page(self, page: List[Dict], cursor_column: str, date_column: str):
+        import numpy as np
+        amounts = np.array([float(row.get(TRANSACTIONS_AMOUNT_COLUMN) or 0.0) for row in page], dtype=np.float64)
+        directions = np.array([str(row.get(TRANSACTIONS_DIRECTION_COLUMN) or "").lower() for row in page])
+        # Debits are flagged by the direction column, or by a negative amount without one
+        is_debit = (directions == "debit") | ((directions == "") & (amounts < 0))
+        amounts = np.abs(amounts)
+        dates = np.array([str(row.get(date_column) or "") for row in page])
+        categories = np.array([str(row.get(TRANSACTIONS_CATEGORY_COLUMN) or "") for row in page])
+
+        debit_total = float(amounts[is_debit].sum())
+        debit_count = int(is_debit.sum())
+        self.totals["count"] += len(page)
+        self.totals["debit_count"] += debit_count
+        self.totals["credit_count"] += len(page) - debit_count
+        self.totals["total_debit"] += debit_total
+        self.totals["total_credit"] += float(amounts.sum()) - debit_total
+        self._merge(self.periods, np, _period_keys(np, dates, self.period), is_debit, amounts)
+        self._merge(self.categories, np, categories, is_debit, amounts)
+
+        present = dates[dates != ""].tolist()
+        if present:
+            earliest, latest = min(present), max(present)
+            self.first_at = earliest if self.first_at is None else min(self.first_at, earliest)
+            self.last_at = latest if self.last_at is None else max(self.last_at, latest)
+        self.cursor = page[-1].get(cursor_column, self.cursor)
+
+    @staticmethod
+    def _finish(bucket: Dict[str, Any]) -> Dict[str, Any]:
+        # Sums are accumulated in floats; report them to the cent
+        return {
+            **bucket,
+            "total_credit": round(bucket["total_credit"], 2),
+            "total_debit": round(bucket["total_debit"], 2),
+            "net": round(bucket["total_credit"] - bucket["total_debit"], 2)
+        }
+
+    def result(self) -> Dict[str, Any]:
+        return {
+            "totals": self._finish(self.totals),
+            "first_transaction_at": self.first_at,
+            "last_transaction_at": self.last_at,
+            "period": self.period,
+            "by_period": [{"period": key, **self._finish(bucket)} for key, bucket in sorted(self.periods.items())],
+            "by_category": [
+                {"category": key, **self._finish(bucket)}
+                for key, bucket in sorted(self.categories.items(), key=lambda item: -item[1]["total_debit"])
+            ]
+        }
+
+
+class _Entry:
+    __slots__ = ("accumulator", "checked_at", "built_at")
+
+    def __init__(self, accumulator: _Accumulator):
+        self.accumulator = accumulator
+        self.checked_at = 0.0
+        self.built_at = time.monotonic()
+
+
+PageSource = Callable[[Optional[Any], List[str]], AsyncIterator[List[Dict]]]
+
+
+class TransactionSummaryCache:
+    """Per-account transaction summaries, extended with only the transactions added since the last request"""
+
+    def __init__(self, max_entries: int = TRANSACTION_SUMMARY_MAX_ENTRIES,
+                 check_interval: float = TRANSACTION_SUMMARY_CHECK_INTERVAL,
+                 max_age: float = TRANSACTION_SUMMARY_MAX_AGE):
+        self.max_entries = max(max_entries, 1)
+        self.check_interval = check_interval
+        self.max_age = max_age
+        self._entries: "OrderedDict[Tuple, _Entry]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.incremental_updates = 0
+        self.rebuilds = 0
+        self.rows_scanned = 0
+        self.evictions = 0
+
+    def _expired(self, entry: _Entry) -> bool:
+        return time.monotonic() - entry.built_at >= self.max_age
+
+    async def _catch_up(self, entry: _Entry, pages: PageSource, cursor_column: str, date_column: str) -> int:
+        accumulator = entry.accumulator
+        columns = list(dict.fromkeys([cursor_column, date_column, TRANSACTIONS_AMOUNT_COLUMN,
+                                      TRANSACTIONS_DIRECTION_COLUMN, TRANSACTIONS_CATEGORY_COLUMN]))
+        scanned = 0
+        async for page in pages(accumulator.cursor, columns):
+            accumulator.add_page(page, cursor_column, date_column)
+            scanned += len(page)
+        entry.checked_at = time.monotonic()
+        self.rows_scanned += scanned
+        return scanned
+
+    async def get(self, account_id: str, period: str, date_from: Optional[str], date_to: Optional[str],
+                  pages: PageSource, cursor_column: str, date_column: str) -> Dict[str, Any]:
+        """Summary for an account, scanning only transactions newer than the cached cursor"""
+        key = (account_id, period, date_from, date_to)
+
+        async def load():
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry):
+                # Edited or deleted transactions sit behind the cursor; only a full scan sees them
+                del self._entries[key]
+                entry = None
+                self.rebuilds += 1
+            if entry is None:
+                self.misses += 1
+                entry = _Entry(_Accumulator(period))
+                await self._catch_up(entry, pages, cursor_column, date_column)
+                self._entries[key] = entry
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+                return entry, False
+            if time.monotonic() - entry.checked_at >= self.check_interval:
+                if await self._catch_up(entry, pages, cursor_column, date_column):
+                    self.incremental_updates += 1
+            return entry, True
+
+        entry = self._entries.get(key)
+        if (entry is not None and time.monotonic() - entry.checked_at < self.check_interval
+                and not self._expired(entry)):
+            cached = True
+        else:
+            # Concurrent requests for the same summary share one scan
+            entry, cached = await single_flight.do(
+                flight_key("transactions.summary", account_id, period=period, date_from=date_from, date_to=date_to),
+                load
+            )
+        if cached:
+            self.hits += 1
+        if key in self._entries:
+            self._entries.move_to_end(key)
+        return {"account_id": account_id, "from": date_from, "to": date_to, "cached": cached,
+                **entry.accumulator.result()}
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and scanned rows"""
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "check_interval_seconds": self.check_interval,
+            "max_age_seconds": self.max_age,
+            "hits": self.hits,
+            "misses": self.misses,
+            "incremental_updates": self.incremental_updates,
+            "rebuilds": self.rebuilds,
+            "rows_scanned": self.rows_scanned,
+            "evictions": self.evictions
+        }
+
+
+# Global transaction summary cache
+transaction_summaries = TransactionSummaryCache()
@@ -0,0 +1,242 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional
+
+# Write-behind settings (overridable through the environment)
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "false").lower() in ("1", "true", "yes")
+WRITE_BEHIND_MAX_QUEUE = int(os.getenv("WRITE_BEHIND_MAX_QUEUE", "20000"))
+WRITE_BEHIND_FLUSH_ROWS = int(os.getenv("WRITE_BEHIND_FLUSH_ROWS", "500"))
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "1.0"))
+WRITE_BEHIND_ENQUEUE_TIMEOUT = float(os.getenv("WRITE_BEHIND_ENQUEUE_TIMEOUT", "5.0"))
+# Failed writes per row before it is dropped as a dead letter; retries back off up to MAX_BACKOFF
+WRITE_BEHIND_MAX_ATTEMPTS = int(os.getenv("WRITE_BEHIND_MAX_ATTEMPTS", "10"))
+WRITE_BEHIND_MAX_BACKOFF = float(os.getenv("WRITE_BEHIND_MAX_BACKOFF", "60"))
+
+
+class WriteBehindQueueFull(Exception):
+    """Raised when the queue stays full for longer than the enqueue timeout"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class WriteBehindQueue:
+    """Coalescing write-behind buffer flushed to storage by a background task"""
+
+    def __init__(self, writer: Callable[[List[Dict]], Awaitable[Any]],
+                 key: Callable[[Dict], Hashable],
+                 max_queue: int = WRITE_BEHIND_MAX_QUEUE,
+                 flush_rows: int = WRITE_BEHIND_FLUSH_ROWS,
+                 flush_interval: float = WRITE_BEHIND_FLUSH_INTERVAL,
+                 enqueue_timeout: float = WRITE_BEHIND_ENQUEUE_TIMEOUT,
+                 max_attempts: int = WRITE_BEHIND_MAX_ATTEMPTS):
+        self.writer = writer
+        self.key = key
+        self.max_queue = max(max_queue, 1)
+        self.flush_rows = max(flush_rows, 1)
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.max_attempts = max(max_attempts, 1)
+        # Latest row per key; rewriting a key replaces the queued row in place
+        self._pending: "OrderedDict[Hashable, Dict]" = OrderedDict()
+        self._oldest_enqueued_at: Optional[float] = None
+        # Failed write attempts per queued key
+        self._attempts: Dict[Hashable, int] = {}
+        self._consecutive_failures = 0
+        # Events are created on first use so they bind to the serving event loop
+        self._wake: Optional[asyncio.Event] = None
+        self._space: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._stopping: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.enqueued_rows = 0
+        self.coalesced_rows = 0
+        self.flushed_rows = 0
+        self.flushes = 0
+        self.flush_failures = 0
+        self.backpressure_waits = 0
+        self.rejected_rows = 0
+        self.dead_letter_rows = 0
+        self.last_flush_latency: Optional[float] = None
+        self.total_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+        self.last_error: Optional[str] = None
+
+    def _events(self):
+        if self._wake is None:
+            self._wake = asyncio.Event()
+            self._space = asyncio.Event()
+            self._space.set()
+            self._flush_lock = asyncio.Lock()
+            self._stopping = asyncio.Event()
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending)
+
+    def _merge(self, rows: Iterable[Dict], overwrite: bool = True):
+        """Add rows to the buffer, coalescing on key"""
+        for row in rows:
+            row_key = self.key(row)
+            if row_key in self._pending:
+                if not overwrite:
+                    # A newer write for this key arrived while the flush was running
+                    continue
+                self.coalesced_rows += 1
+            if overwrite:
+                # A new version of the row starts its attempt count again
+                self._attempts.pop(row_key, None)
+            self._pending[row_key] = row
+        if self._pending and self._oldest_enqueued_at is None:
+            self._oldest_enqueued_at = time.monotonic()
+        if len(self._pending) >= self.max_queue:
+            self._space.clear()
+
+    async def enqueue(self, rows: List[Dict]):
+        """Queue rows for storage, waiting for space when the buffer is full"""
+        self._events()
+        new_keys = {self.key(row) for row in rows} - self._pending.keys()
+        deadline = time.monotonic() + self.enqueue_timeout
+        while new_keys and len(self._pending) + len(new_keys) > self.max_queue:
+            self.backpressure_waits += 1
+            self._space.clear()
+            self._wake.set()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.rejected_rows += len(rows)
+                raise WriteBehindQueueFull(
+                    f"Write-behind queue is full ({len(self._pending)}/{self.max_queue} rows)",
+                    retry_after=self.flush_interval
+                )
+            try:
+                await asyncio.wait_for(self._space.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                pass
+            new_keys = {self.key(row) for row in rows} - self._pending.keys()
+
+        self.enqueued_rows += len(rows)
+        self._merge(rows)
+        if len(self._pending) >= self.flush_rows:
+            self._wake.set()
+
+    async def flush(self) -> int:
+        """Write everything currently buffered; failed rows go back on the queue"""
+        self._events()
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            batch = list(self._pending.values())
+            self._pending = OrderedDict()
+            self._oldest_enqueued_at = None
+            self._space.set()
+
+            started = time.perf_counter()
+            try:
+                await self.writer(batch)
+                failed: List[Dict] = []
+            except asyncio.CancelledError:
+                # Outcome unknown; requeue so a later flush (upserts are idempotent) writes it
+                self._merge(batch, overwrite=False)
+                raise
+            except Exception as e:
+                self.flush_failures += 1
+                self.last_error = str(e)
+                failed = getattr(e, "failed_rows", None) or batch
+
+            elapsed = time.perf_counter() - started
+            self.flushes += 1
+            self.last_flush_latency = elapsed
+            self.total_flush_latency += elapsed
+            self.max_flush_latency = max(self.max_flush_latency, elapsed)
+            self.flushed_rows += len(batch) - len(failed)
+            self._consecutive_failures = self._consecutive_failures + 1 if failed else 0
+            failed_keys = {self.key(row) for row in failed}
+            for row in batch:
+                row_key = self.key(row)
+                if row_key not in failed_keys:
+                    self._attempts.pop(row_key, None)
+            retry = []
+            for row in failed:
+                row_key = self.key(row)
+                attempts = self._attempts.get(row_key, 0) + 1
+                if attempts >= self.max_attempts:
+                    # Rejected every time (e.g. bad data); stop it holding queue space forever
+                    self._attempts.pop(row_key, None)
+                    self.dead_letter_rows += 1
+                    continue
+                self._attempts[row_key] = attempts
+                retry.append(row)
+            if retry:
+                self._merge(retry, overwrite=False)
+            return len(batch) - len(failed)
+
+    async def _run(self):
+        """Flush on the size threshold or once the oldest row has waited flush_interval"""
+        self._events()
+        while not self._stopping.is_set():
+            timeout = self.flush_interval
+            if self._oldest_enqueued_at is not None:
+                timeout = max(self._oldest_enqueued_at + self.flush_interval - time.monotonic(), 0)
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if self._pending and not self._stopping.is_set():
+                await self.flush()
+                if self._consecutive_failures:
+                    # Back off before retrying a failing store; stop() cuts the wait short
+                    backoff = min(self.flush_interval * 2 ** (self._consecutive_failures - 1), WRITE_BEHIND_MAX_BACKOFF)
+                    try:
+                        await asyncio.wait_for(self._stopping.wait(), timeout=backoff)
+                    except asyncio.TimeoutError:
+                        pass
+
+    def start(self):
+        """Start the background flusher"""
+        self._events()
+        if self._task is None or self._task.done():
+            self._stopping.clear()
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self, drain_attempts: int = 3) -> int:
+        """Stop the flusher and drain whatever is still queued; returns the rows left unwritten"""
+        self._events()
+        if self._task is not None:
+            # Let a write in progress finish rather than cancelling it mid-request
+            self._stopping.set()
+            self._wake.set()
+            await self._task
+            self._task = None
+        for _ in range(max(drain_attempts, 1)):
+            if not self._pending:
+                break
+            await self.flush()
+        return len(self._pending)
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, coalescing and flush latency counters"""
+        oldest_age = None
+        if self._oldest_enqueued_at is not None:
+            oldest_age = time.monotonic() - self._oldest_enqueued_at
+        return {
+            "enabled": WRITE_BEHIND_ENABLED,
+            "depth": len(self._pending),
+            "max_queue": self.max_queue,
+            "oldest_row_age_seconds": oldest_age,
+            "enqueued_rows": self.enqueued_rows,
+            "coalesced_rows": self.coalesced_rows,
+            "flushed_rows": self.flushed_rows,
+            "flushes": self.flushes,
+            "flush_failures": self.flush_failures,
+            "backpressure_waits": self.backpressure_waits,
+            "rejected_rows": self.rejected_rows,
+            "dead_letter_rows": self.dead_letter_rows,
+            "last_flush_latency_seconds": self.last_flush_latency,
+            "avg_flush_latency_seconds": self.total_flush_latency / self.flushes if self.flushes else None,
+            "max_flush_latency_seconds": self.max_flush_latency,
+            "last_error": self.last_error
+        }